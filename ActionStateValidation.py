@@ -1,7 +1,5 @@
 import math
 from search import astar_graph_search as astar_graph
-from PathfindingProblems import PathfindingProblems
-from itertools import combinations
 from Utility import Utility
 
 class ActionStateValidation:
@@ -98,108 +96,92 @@ class ActionStateValidation:
 
 
     @staticmethod
-    def check_box_can_go_target(walls, targets, boxes):
+    def is_box_stuck(puzzle, layout, position, targets):
         """
-        Checks if all boxes can potentially be moved to any target location.
+        Check if a box is stuck in a particular position within the layout.
 
         Parameters:
-        - walls (list): List of wall coordinates.
-        - targets (list): List of target coordinates where boxes need to be placed.
-        - boxes (list): List of current box coordinates.
+        - layout: The warehouse layout with walls and spaces.
+        - position: Tuple indicating the position of the box.
+        - targets: List of target positions in the warehouse.
 
         Returns:
-        - bool: True if all boxes can be moved to any target location, False otherwise.
+        - True if the box is stuck in the given position, otherwise False.
         """
+        temp_taboo_cells = Utility.get_temp_taboo_cells(puzzle, layout, targets)
+        if position in temp_taboo_cells:
+            return True
+        return False 
+ 
+
 
-        # Loop through each box
-        for box in boxes: 
-            # Check if box is not already on a target
-            if box not in targets:  
-                b_can_not_go = True
-                # Loop through each target
-                for target in targets:
-                    dst = (target[1], target[0]) 
-
-                    # Check if the box can be moved to the current target using A* algorithm
-                    nodes = astar_graph(PathfindingProblems.CanBoxGoTargetProblem(box, target, walls, boxes), ActionStateValidation.heuristic_canboxgo)
-
-                    # If a path is found, set b_can_not_go to False and break
-                    if nodes is not None:
-                        b_can_not_go = False
-                        break
-                # If box cannot be moved to any target, return False
-                if b_can_not_go:
-                    return False
-
-        # If all boxes can be moved to at least one target, return True
-        return True
-    
     @staticmethod
-    def check_stucked_case_no_warehouse(puzzle, boxes):
+    def is_freeze_deadlock(board, boxes, old_box, new_box):
         """
-        Determine if any box becomes stuck when moved to a new position.
+        Check if pushing a box from old_box to new_box freezes a box that is not on a target.
+
+        A box is frozen when it can move neither horizontally nor vertically. It is blocked along
+        an axis if there is a wall on one side, a dead square on both sides, or a box on one side
+        that is frozen itself (the box being checked counts as a wall for it). This covers the
+        2x2 blocks and the boxes frozen against a wall. Only the pushed box and the boxes next to it
+        are visited, so the check is done on every push instead of on the whole state.
 
         Parameters:
-        - boxes: List of positions of all boxes.
+        - board: The StaticBoard of the puzzle.
+        - boxes: Cell ids of the boxes before the push (any container).
+        - old_box: Cell id of the box before the push.
+        - new_box: Cell id of the box after the push.
 
         Returns:
-        - True if any box becomes stuck in a new position, otherwise False.
+        - True if the state after the push is a deadlock, otherwise False.
         """
-       
-
-        # Create an initial layout filled with spaces based on puzzle dimensions
-        layout = [[' ' for _ in range(puzzle.x_size)] for _ in range(puzzle.y_size)]
-
-        # Populate the layout with wall positions
-        for (x, y) in puzzle.walls:
-            layout[y][x] = '#'
-
-        # Generate all possible pairs of boxes
-        pairs = list(combinations(boxes, 2))
-
-        n_pairs = len(pairs)
-
-        stuck_count = 0
-        for pair in pairs:
-            # Temporarily treat one of the boxes in the pair as a wall
-            layout[pair[0][1]][pair[0][0]] = '#' 
-
-            # Check if the other box in the pair becomes stuck when the first one is a wall
-            if ActionStateValidation.is_box_stuck(puzzle, layout, pair[1], puzzle.targets):
-                # Swap the roles of the boxes and re-check
-                layout[pair[0][1]][pair[0][0]] = ' ' 
-                layout[pair[1][1]][pair[1][0]] = '#' 
-                if ActionStateValidation.is_box_stuck(puzzle, layout, pair[0], puzzle.targets):
-                    stuck_count += 1
-
-            # Reset the boxes' positions back to their original state
-            layout[pair[1][1]][pair[1][0]] = ' ' 
-            layout[pair[0][1]][pair[0][0]] = ' ' 
-
-        # If the count of instances where boxes are stuck is significant, conclude that the move is problematic
-        if stuck_count >= 1:
-            return True
+        frozen = ActionStateValidation.frozen_boxes(board, boxes, old_box, new_box, new_box, set())
+        if frozen is None:
+            return False
+        return any(not board.is_target[box] for box in frozen)
 
-        return False
+    @staticmethod
+    def frozen_boxes(board, boxes, old_box, new_box, box, checking):
+        """
+        Boxes found frozen while checking the box on cell 'box' (see is_freeze_deadlock).
 
-    
+        Returns:
+        - list: The cell ids of box and of the boxes that freeze it, None if the box is not frozen.
+        """
+        checking.add(box)
+        frozen = [box]
+        # Neighbour indices of the horizontal (Left, Right) and vertical (Up, Down) axes.
+        for side_a, side_b in ((0, 1), (2, 3)):
+            blocked = ActionStateValidation.axis_blocked(board, boxes, old_box, new_box, box, side_a, side_b, checking)
+            if blocked is None:
+                checking.discard(box)
+                return None
+            frozen.extend(blocked)
+        checking.discard(box)
+        return frozen
 
     @staticmethod
-    def is_box_stuck(puzzle, layout, position, targets):
+    def axis_blocked(board, boxes, old_box, new_box, box, side_a, side_b, checking):
         """
-        Check if a box is stuck in a particular position within the layout.
-
-        Parameters:
-        - layout: The warehouse layout with walls and spaces.
-        - position: Tuple indicating the position of the box.
-        - targets: List of target positions in the warehouse.
+        Check if the box on cell 'box' can not move along one axis.
 
         Returns:
-        - True if the box is stuck in the given position, otherwise False.
+        - list: The boxes that block the axis (empty for walls and dead squares), None if the axis is free.
         """
-        temp_taboo_cells = Utility.get_temp_taboo_cells(puzzle, layout, targets)
-        if position in temp_taboo_cells:
-            return True
-        return False 
- 
-
+        cell_a, cell_b = board.neighbours[box][side_a], board.neighbours[box][side_b]
+        # A wall on either side.
+        if cell_a < 0 or cell_b < 0:
+            return []
+        # A dead square on both sides.
+        if board.is_dead[cell_a] and board.is_dead[cell_b]:
+            return []
+        for cell in (cell_a, cell_b):
+            if cell != new_box and (cell == old_box or cell not in boxes):
+                continue
+            # A box already being checked is treated as a wall.
+            if cell in checking:
+                return []
+            frozen = ActionStateValidation.frozen_boxes(board, boxes, old_box, new_box, cell, checking)
+            if frozen is not None:
+                return frozen
+        return None
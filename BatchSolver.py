@@ -0,0 +1,259 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.connection import wait
+
+from sokoban import Warehouse
+from Solver import Solver
+from Heuristics import Heuristics
+from BoardCache import BoardCache
+from TranspositionTable import TranspositionTable
+
+
+class BatchSolver:
+    '''
+    Solve many warehouses in parallel from the command line.
+
+    Every warehouse is solved in its own worker process (at most 'processes' at a time),
+    so a puzzle that runs past its time limit or memory cap is killed without blocking
+    or crashing the rest of the batch. A result line is written as soon as a solve finishes.
+
+    Example:
+        python BatchSolver.py warehouses/ --processes 8 --timeout 60 --output results.jsonl
+    '''
+
+    # Extra seconds given to a worker past its search time limit before it is killed
+    # (the search itself stops at the time limit and reports its partial statistics).
+    KILL_GRACE = 5
+
+    # Columns of the result records (and of the CSV output).
+    FIELDS = ['warehouse', 'status', 'elapsed_time', 'process_time', 'path', 'stucked',
+              'expanded', 'generated', 'nodes_per_second', 'frontier_max', 'limit_reached', 'peak_rss', 'answer']
+
+    @staticmethod
+    def find_warehouses(paths):
+        '''
+        Expand a list of directories, files and glob patterns into a sorted list of warehouse files.
+        '''
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(glob.glob(os.path.join(path, '*.txt')))
+            else:
+                files.extend(glob.glob(path))
+        return sorted(set(files))
+
+    @staticmethod
+    def peak_rss():
+        '''
+        Peak resident set size of the current process in MB (None where the resource module is missing).
+        '''
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+    @staticmethod
+    def solve_one(warehouse_file, options, conn):
+        '''
+        Solve one warehouse and send its result record through conn (runs in the worker process).
+        '''
+        # Cap the address space of this worker so that a runaway search fails with a MemoryError.
+        if options.get('memory_limit'):
+            try:
+                import resource
+                limit = options['memory_limit'] * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            except (ImportError, ValueError, OSError):
+                pass
+
+        # The solver prints progress messages, keep them out of the results.
+        sys.stdout = open(os.devnull, 'w')
+
+        record = {'warehouse': os.path.basename(warehouse_file)}
+        start_time = time.process_time()
+        try:
+            warehouse = Warehouse()
+            warehouse.load_warehouse(warehouse_file)
+            table = None
+            if options.get('tt_capacity'):
+                table = TranspositionTable(options['tt_capacity'], options.get('tt_policy', 'two_tier'))
+            answer = Solver.solve_sokoban_macro(warehouse, options['allow_taboo_push'],
+                                                getattr(Heuristics, options['heuristic']),
+                                                compact_states=options['compact_states'],
+                                                push_level=options['push_level'],
+                                                engine=options.get('engine', 'best_first'),
+                                                time_limit=options.get('time_limit'),
+                                                node_limit=options.get('node_limit'),
+                                                board_cache=BoardCache(options['board_cache']) if options.get('board_cache') else None,
+                                                zobrist=options.get('zobrist', False),
+                                                transposition_table=table,
+                                                freeze_deadlocks=options.get('freeze_deadlocks', True),
+                                                pair_deadlocks=options.get('pair_deadlocks'),
+                                                push_macros=options.get('push_macros', False))
+            if answer == ['Timeout']:
+                record['status'] = 'timeout'
+            else:
+                record['status'] = 'impossible' if answer == ['Impossible'] else 'solved'
+            record['answer'] = str(answer)
+            record['path'] = len(answer) if record['status'] == 'solved' else None
+            if Solver.puzzle is not None:
+                record['stucked'] = Solver.puzzle.stucked_case_count
+            if Solver.stats is not None:
+                record.update(Solver.stats.as_dict())
+            if table is not None:
+                record.update(table.stats())
+        except MemoryError:
+            record['status'] = 'memory'
+        except Exception as e:
+            record['status'] = 'error'
+            record['answer'] = repr(e)
+        record['process_time'] = round(time.process_time() - start_time, 3)
+        record['peak_rss'] = BatchSolver.peak_rss()
+        conn.send(record)
+        conn.close()
+
+    @staticmethod
+    def run(warehouse_files, options, write_record, processes=None, timeout=None):
+        '''
+        Solve all the warehouse files, at most 'processes' at a time.
+
+        Parameters:
+        - warehouse_files: List of warehouse file paths.
+        - options: Dictionary of solver options (heuristic, engine, allow_taboo_push, compact_states, push_level,
+                   memory_limit, time_limit, node_limit, board_cache, zobrist,
+                   tt_capacity, tt_policy, freeze_deadlocks, pair_deadlocks, push_macros).
+        - write_record: Function called with each result record as soon as it is available.
+        - processes: Number of worker processes (default: number of cores).
+        - timeout: Time in seconds after which a worker is killed (default: no limit).
+        '''
+        processes = processes or os.cpu_count() or 1
+        pending = list(reversed(warehouse_files))
+        running = {}  # connection -> (process, warehouse file, start time)
+
+        while pending or running:
+            # Start new workers while there are free slots.
+            while pending and len(running) < processes:
+                warehouse_file = pending.pop()
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=BatchSolver.solve_one, args=(warehouse_file, options, sender), daemon=True)
+                process.start()
+                sender.close()
+                running[receiver] = (process, warehouse_file, time.time())
+
+            # Wait for a result, a worker exit, or the next deadline.
+            wait_time = None
+            if timeout is not None:
+                next_deadline = min(start + timeout for _, _, start in running.values())
+                wait_time = max(0, next_deadline - time.time())
+            ready = wait(list(running) + [process.sentinel for process, _, _ in running.values()], wait_time)
+
+            now = time.time()
+            for receiver in list(running):
+                process, warehouse_file, start = running[receiver]
+                record = None
+                if receiver in ready or process.sentinel in ready:
+                    try:
+                        if receiver.poll():
+                            record = receiver.recv()
+                    except (EOFError, OSError):
+                        pass
+                    if record is None and process.is_alive():
+                        continue
+                    if record is None:
+                        # The worker died without sending a result (e.g. killed by the memory cap).
+                        record = {'warehouse': os.path.basename(warehouse_file), 'status': 'error'}
+                elif timeout is not None and now - start >= timeout:
+                    process.kill()
+                    record = {'warehouse': os.path.basename(warehouse_file), 'status': 'timeout'}
+                else:
+                    continue
+
+                process.join()
+                receiver.close()
+                del running[receiver]
+                record['elapsed_time'] = round(now - start, 3)
+                write_record(record)
+
+    @staticmethod
+    def main(argv=None):
+        '''
+        Command line entry point.
+        '''
+        parser = argparse.ArgumentParser(description='Solve a batch of Sokoban warehouses in parallel.')
+        parser.add_argument('paths', nargs='+', help='warehouse files, directories or glob patterns')
+        parser.add_argument('--processes', type=int, default=None, help='number of worker processes (default: number of cores)')
+        parser.add_argument('--timeout', type=float, default=None, help='time limit per warehouse in seconds')
+        parser.add_argument('--node-limit', type=int, default=None, help='maximum number of expanded nodes per warehouse')
+        parser.add_argument('--board-cache', default=None, help='directory of the precomputed board cache (default: no cache)')
+        parser.add_argument('--memory-limit', type=int, default=None, help='memory cap per worker in MB')
+        parser.add_argument('--output', default=None, help='output file, .csv or .jsonl (default: JSONL on stdout)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None, help='output format (default: from the output file extension)')
+        parser.add_argument('--heuristic', default='heuristic83Lookup', help='name of a Heuristics method')
+        parser.add_argument('--engine', choices=sorted(Solver.ENGINES), default='best_first', help='search engine')
+        parser.add_argument('--allow-taboo-push', action='store_true', help='allow pushing boxes on taboo cells')
+        parser.add_argument('--compact-states', action='store_true', help='use the compact integer state encoding')
+        parser.add_argument('--push-level', action='store_true', help='search over pushes instead of worker steps')
+        parser.add_argument('--tt-capacity', type=int, default=None, help='bound the explored states with a transposition table of this many entries')
+        parser.add_argument('--tt-policy', choices=TranspositionTable.POLICIES, default='two_tier', help='replacement policy of the transposition table')
+        parser.add_argument('--zobrist', action='store_true', help='hash the states with incremental Zobrist keys')
+        parser.add_argument('--push-macros', action='store_true', help='with --push-level, use tunnel and goal-room macro pushes')
+        parser.add_argument('--pair-deadlocks', choices=['wait', 'background'], default=None,
+                            help='prune dead pairs of boxes with the two-box deadlock table, built before the search or in the background')
+        parser.add_argument('--no-freeze-deadlocks', action='store_true', help='do not prune the pushes that freeze a box off target')
+        args = parser.parse_args(argv)
+
+        warehouse_files = BatchSolver.find_warehouses(args.paths)
+        if not warehouse_files:
+            parser.error('no warehouse file found')
+
+        options = {
+            'heuristic': args.heuristic,
+            'engine': args.engine,
+            'allow_taboo_push': args.allow_taboo_push,
+            'compact_states': args.compact_states,
+            'push_level': args.push_level,
+            'zobrist': args.zobrist,
+            'freeze_deadlocks': not args.no_freeze_deadlocks,
+            'pair_deadlocks': args.pair_deadlocks,
+            'push_macros': args.push_macros,
+            'tt_capacity': args.tt_capacity,
+            'tt_policy': args.tt_policy,
+            'memory_limit': args.memory_limit,
+            'time_limit': args.timeout,
+            'node_limit': args.node_limit,
+            'board_cache': args.board_cache,
+        }
+
+        output_format = args.format or ('csv' if args.output and args.output.endswith('.csv') else 'jsonl')
+        out = open(args.output, 'w', newline='') if args.output else sys.stdout
+        try:
+            if output_format == 'csv':
+                writer = csv.DictWriter(out, fieldnames=BatchSolver.FIELDS, extrasaction='ignore')
+                writer.writeheader()
+
+            def write_record(record):
+                if output_format == 'csv':
+                    writer.writerow(record)
+                else:
+                    out.write(json.dumps(record) + '\n')
+                out.flush()
+
+            # The search stops itself at the time limit, the worker is only killed if it does not.
+            kill_timeout = args.timeout + BatchSolver.KILL_GRACE if args.timeout is not None else None
+            BatchSolver.run(warehouse_files, options, write_record, args.processes, kill_timeout)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == "__main__":
+    BatchSolver.main()
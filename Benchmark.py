@@ -0,0 +1,300 @@
+import argparse
+import copy
+import json
+import os
+import sys
+from array import array
+
+from BatchSolver import BatchSolver
+from Solver import Solver
+from Heuristics import Heuristics, numpy
+from SokobanPuzzle import SokobanPuzzle
+from sokoban import Warehouse
+
+
+class Benchmark:
+    '''
+    Reproducible benchmark of the solver over a set of warehouses.
+
+    Every combination of search engine, heuristic and state mode is run on every warehouse
+    (one worker process per solve, one solve at a time by default so that timings are comparable).
+    For each run the report gives the nodes expanded and generated, nodes per second,
+    peak RSS, frontier high-water mark and solution length.
+
+    The results can be compared with a stored baseline file to catch regressions in
+    search.py or Heuristics, and the baseline can be refreshed with --update-baseline.
+    --check-vectorized compares the NumPy heuristics with their Python forms instead (see check_vectorized).
+
+    Example:
+        python Benchmark.py warehouses/warehouse_0*.txt --engines best_first astar --modes push
+    '''
+
+    # State modes: keyword arguments of Solver.solve_sokoban_macro.
+    MODES = {
+        'elementary': {'compact_states': False, 'push_level': False},
+        'compact': {'compact_states': True, 'push_level': False},
+        'push': {'compact_states': False, 'push_level': True},
+    }
+
+    # Values compared with the baseline, and the relative increase allowed before it counts as a regression.
+    # The search values are deterministic, they do not depend on the machine.
+    TOLERANCES = {
+        'path': 0.0,
+        'expanded': 0.05,
+        'generated': 0.05,
+        'frontier_max': 0.05,
+    }
+
+    # Timings and memory depend on the machine and are noisy, they are only compared on request
+    # (--compare-resources, with a baseline recorded on the same machine).
+    RESOURCE_TOLERANCES = {
+        'elapsed_time': 0.5,
+        'peak_rss': 0.25,
+    }
+
+    BASELINE_VERSION = 1
+
+    @staticmethod
+    def config_name(engine, heuristic, mode):
+        return '{}/{}/{}'.format(engine, heuristic, mode)
+
+    @staticmethod
+    def run(warehouse_files, engines, heuristics, modes, timeout=None, memory_limit=None, processes=1, allow_taboo_push=False):
+        '''
+        Run every configuration on every warehouse.
+
+        Returns:
+        - dict: For each configuration name, a dictionary of result records keyed by warehouse name.
+        '''
+        results = {}
+        for engine in engines:
+            for heuristic in heuristics:
+                for mode in modes:
+                    name = Benchmark.config_name(engine, heuristic, mode)
+                    options = {'heuristic': heuristic, 'engine': engine, 'allow_taboo_push': allow_taboo_push,
+                               'memory_limit': memory_limit, 'time_limit': timeout}
+                    options.update(Benchmark.MODES[mode])
+                    records = results[name] = {}
+
+                    def write_record(record):
+                        record.pop('answer', None)
+                        records[record['warehouse']] = record
+                        print('{:<45} {:<18} {}'.format(name, record['warehouse'], Benchmark.format_record(record)), file=sys.stderr)
+
+                    kill_timeout = timeout + BatchSolver.KILL_GRACE if timeout is not None else None
+                    BatchSolver.run(warehouse_files, options, write_record, processes, kill_timeout)
+        return results
+
+    @staticmethod
+    def format_record(record):
+        if record['status'] != 'solved':
+            return '{:<8} {:>8.2f}s expanded {}'.format(record['status'], record['elapsed_time'], record.get('expanded'))
+        return '{:<8} {:>8.2f}s path {:>4} expanded {:>8} generated {:>9} {:>7} nodes/s frontier {:>7} rss {:>7} MB'.format(
+            record['status'], record['elapsed_time'], record['path'], record.get('expanded'), record.get('generated'),
+            record.get('nodes_per_second'), record.get('frontier_max'), record.get('peak_rss'))
+
+    @staticmethod
+    def summary(results):
+        '''
+        One line of totals per configuration.
+        '''
+        lines = []
+        for name, records in results.items():
+            solved = [r for r in records.values() if r['status'] == 'solved']
+            search_time = sum(r.get('search_time', 0) for r in solved)
+            expanded = sum(r.get('expanded', 0) for r in solved)
+            lines.append('{:<45} solved {:>3}/{:<3} expanded {:>9} time {:>8.2f}s {:>7} nodes/s max rss {} MB'.format(
+                name, len(solved), len(records), expanded, sum(r['elapsed_time'] for r in records.values()),
+                round(expanded / search_time) if search_time > 0 else 0,
+                max((r.get('peak_rss') or 0 for r in records.values()), default=0)))
+        return lines
+
+    @staticmethod
+    def compare(results, baseline, resources=False):
+        '''
+        Compare benchmark results with a baseline.
+
+        Parameters:
+        - results: Results returned by Benchmark.run.
+        - baseline: Results loaded from a baseline file.
+        - resources: Also compare the timings and memory (RESOURCE_TOLERANCES).
+
+        Returns:
+        - list: Description of each regression (empty if there is none).
+        '''
+        tolerances = dict(Benchmark.TOLERANCES)
+        if resources:
+            tolerances.update(Benchmark.RESOURCE_TOLERANCES)
+
+        regressions = []
+        for name, records in results.items():
+            for warehouse, record in records.items():
+                reference = baseline.get(name, {}).get(warehouse)
+                if reference is None:
+                    continue
+                if reference['status'] == 'solved' and record['status'] != 'solved':
+                    regressions.append('{} {}: {} (was solved)'.format(name, warehouse, record['status']))
+                    continue
+                if record['status'] != 'solved' or reference['status'] != 'solved':
+                    continue
+                for field, tolerance in tolerances.items():
+                    old, new = reference.get(field), record.get(field)
+                    if old is None or new is None:
+                        continue
+                    # Ignore the noise of very short runs.
+                    if field == 'elapsed_time' and new < 0.5:
+                        continue
+                    if new > old * (1 + tolerance):
+                        regressions.append('{} {}: {} {} -> {}'.format(name, warehouse, field, old, new))
+        return regressions
+
+    @staticmethod
+    def check_vectorized(warehouse_files, depth=2):
+        '''
+        Compare the NumPy forms of the heuristics (Heuristics.VECTORIZED) with their Python forms.
+
+        Both forms are evaluated on the states reached in up to 'depth' pushes from each warehouse
+        (taboo pushes included) plus a state with a box on a dead square, on the board of the
+        warehouse and on a copy of it where a box cell can not be reached from the other cells
+        (distance -1).
+
+        Returns:
+        - list: Description of each mismatch (empty if there is none), None if NumPy is not installed.
+        '''
+        if numpy is None:
+            return None
+
+        mismatches = []
+        for warehouse_file in warehouse_files:
+            warehouse = Warehouse()
+            warehouse.load_warehouse(warehouse_file)
+            puzzle = SokobanPuzzle(warehouse, allow_taboo_push=True, macro=True, freeze_deadlocks=False)
+            board = puzzle.board
+
+            seen = {puzzle.initial}
+            frontier = [puzzle.initial]
+            for _ in range(depth):
+                children = []
+                for state in frontier:
+                    for action in puzzle.actions(state):
+                        child = puzzle.result(state, action)
+                        if child not in seen:
+                            seen.add(child)
+                            children.append(child)
+                frontier = children
+            states = sorted(puzzle.state_to_ids(state) for state in seen)
+
+            # The initial state with its first box moved to a free dead square.
+            worker, boxes = puzzle.state_to_ids(puzzle.initial)
+            dead = [cell for cell in sorted(board.dead_ids) if cell not in boxes]
+            if dead:
+                states.append((worker, tuple(sorted(boxes[1:] + (dead[0],)))))
+
+            # The same board with the cell of the first box cut off from every other cell.
+            n_cells = len(board.cells)
+            distance_matrix = array('i', board.distance_matrix)
+            for cell in range(n_cells):
+                if cell != boxes[0]:
+                    distance_matrix[boxes[0] * n_cells + cell] = distance_matrix[cell * n_cells + boxes[0]] = -1
+            unreachable = copy.copy(board)
+            unreachable.distance_matrix = distance_matrix
+            unreachable.numpy_tables = None
+
+            for board_name, checked_board in (('', board), (' (unreachable cell)', unreachable)):
+                for h, vectorized in Heuristics.VECTORIZED.items():
+                    for state, expected, value in zip(states, [h(checked_board, state) for state in states],
+                                                      vectorized(checked_board, states)):
+                        if value != expected:
+                            mismatches.append('{}{} {} {}: {} (Python {})'.format(
+                                os.path.basename(warehouse_file), board_name, vectorized.__name__, state, value, expected))
+        return mismatches
+
+    @staticmethod
+    def load_baseline(filename):
+        with open(filename) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != Benchmark.BASELINE_VERSION:
+            raise ValueError('unsupported baseline version in ' + filename)
+        return baseline['results']
+
+    @staticmethod
+    def save_baseline(filename, results, baseline=None):
+        '''
+        Write the results to the baseline file, keeping the baseline entries that were not run again.
+        '''
+        merged = dict(baseline or {})
+        for name, records in results.items():
+            merged[name] = dict(merged.get(name, {}), **records)
+        with open(filename, 'w') as f:
+            json.dump({'version': Benchmark.BASELINE_VERSION, 'results': merged}, f, indent=1, sort_keys=True)
+            f.write('\n')
+
+    @staticmethod
+    def main(argv=None):
+        '''
+        Command line entry point. Exits with status 1 when a regression is found.
+        '''
+        parser = argparse.ArgumentParser(description='Benchmark the Sokoban solver against a baseline.')
+        parser.add_argument('paths', nargs='*', default=['warehouses/'], help='warehouse files, directories or glob patterns')
+        parser.add_argument('--engines', nargs='+', choices=sorted(Solver.ENGINES), default=['best_first'])
+        parser.add_argument('--heuristics', nargs='+', default=['heuristic83Lookup'], help='names of Heuristics methods')
+        parser.add_argument('--modes', nargs='+', choices=sorted(Benchmark.MODES), default=['push'])
+        parser.add_argument('--timeout', type=float, default=30, help='time limit per warehouse in seconds')
+        parser.add_argument('--memory-limit', type=int, default=None, help='memory cap per worker in MB')
+        parser.add_argument('--processes', type=int, default=1, help='number of worker processes (timings are noisier above 1)')
+        parser.add_argument('--baseline', default='benchmark_baseline.json', help='baseline file')
+        parser.add_argument('--update-baseline', action='store_true', help='store the results in the baseline file')
+        parser.add_argument('--compare-resources', action='store_true',
+                            help='also compare the elapsed time and peak RSS (baseline recorded on the same machine)')
+        parser.add_argument('--check-vectorized', action='store_true',
+                            help='only compare the NumPy heuristics with their Python forms on the warehouses')
+        parser.add_argument('--output', default=None, help='write all the result records to this JSON file')
+        args = parser.parse_args(argv)
+
+        warehouse_files = BatchSolver.find_warehouses(args.paths)
+        if not warehouse_files:
+            parser.error('no warehouse file found')
+
+        if args.check_vectorized:
+            mismatches = Benchmark.check_vectorized(warehouse_files)
+            if mismatches is None:
+                print('NumPy is not installed, the vectorized heuristics are not checked')
+                return 0
+            for mismatch in mismatches:
+                print('MISMATCH', mismatch)
+            print('{} mismatch(es) between the NumPy and Python heuristics'.format(len(mismatches)))
+            return 1 if mismatches else 0
+
+        results = Benchmark.run(warehouse_files, args.engines, args.heuristics, args.modes,
+                                args.timeout, args.memory_limit, args.processes)
+
+        for line in Benchmark.summary(results):
+            print(line)
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=1, sort_keys=True)
+
+        try:
+            baseline = Benchmark.load_baseline(args.baseline)
+        except FileNotFoundError:
+            baseline = None
+
+        if args.update_baseline:
+            Benchmark.save_baseline(args.baseline, results, baseline)
+            print('Baseline written to', args.baseline)
+            return 0
+
+        if baseline is None:
+            print('No baseline file', args.baseline)
+            return 0
+
+        regressions = Benchmark.compare(results, baseline, args.compare_resources)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        print('{} regression(s) against {}'.format(len(regressions), args.baseline))
+        return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(Benchmark.main())
@@ -0,0 +1,285 @@
+import hashlib
+import os
+import struct
+import sys
+from array import array
+
+import search
+from StaticBoard import StaticBoard
+from DeadlockTable import DeadlockTable
+
+
+class BoardCache:
+    '''
+    Persistent cache of the static board precomputation (taboo cells, inside cells,
+    distance tables) and of the two-box deadlock tables, keyed by a canonical hash
+    of the walls and targets of a warehouse.
+
+    The static board only depends on the walls and targets, so every solve of a layout
+    that was already seen (with any worker and box placement) skips the preprocessing.
+    Boards are kept in memory (bounded LRU) and in one compact binary file per layout
+    in the cache directory. The directory is kept under max_bytes by deleting the least
+    recently used files.
+
+    Example:
+        cache = BoardCache()
+        puzzle = SokobanPuzzle(warehouse, board_cache=cache)
+    '''
+
+    # File format version, files written with another version are ignored and rewritten.
+    FORMAT_VERSION = 1
+    MAGIC = b'SOKB'
+
+    # magic, version, x_size, y_size, number of cells, targets and taboo cells, length of the taboo map
+    HEADER = struct.Struct('<4s7I')
+
+    # Deadlock table files: magic, version, number of cells, number of dead pairs.
+    PAIRS_MAGIC = b'SOKP'
+    PAIRS_HEADER = struct.Struct('<4s3I')
+
+    DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'sokoban-boards')
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024, memory_size=64):
+        '''
+        Parameters:
+        - directory: Cache directory (default: $SOKOBAN_CACHE_DIR or ~/.cache/sokoban-boards).
+        - max_bytes: Maximum total size of the cache files.
+        - memory_size: Number of boards kept in memory.
+        '''
+        self.directory = directory or os.environ.get('SOKOBAN_CACHE_DIR') or BoardCache.DEFAULT_DIRECTORY
+        self.max_bytes = max_bytes
+        self.boards = search.LRUCache(memory_size)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def layout_key(walls, targets):
+        '''
+        Canonical hash of a layout (hex string), independent of the order of the walls and targets.
+        '''
+        text = 'walls:{};targets:{}'.format(sorted(walls), sorted(targets))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def filename(self, key, kind=''):
+        return os.path.join(self.directory, key + kind + '.bin')
+
+    def board(self, warehouse):
+        '''
+        Static board of a warehouse, from the memory cache, the cache file or computed (and stored).
+        '''
+        key = BoardCache.layout_key(warehouse.walls, warehouse.targets)
+        board = self.boards.get(key)
+        if board is not None:
+            self.hits += 1
+            return board
+
+        precomputed = self.read(key)
+        if precomputed is not None:
+            self.hits += 1
+            board = StaticBoard(warehouse, precomputed)
+        else:
+            self.misses += 1
+            board = StaticBoard(warehouse)
+            self.write(key, board)
+        self.boards.put(key, board)
+        return board
+
+    def deadlock_table(self, warehouse, background=False):
+        '''
+        Two-box deadlock table of a warehouse (a DeadlockTable), from the memory cache,
+        the cache file or computed (and stored once it is built).
+
+        Parameters:
+        - background: Compute a missing table in a background thread.
+        '''
+        key = BoardCache.layout_key(warehouse.walls, warehouse.targets)
+        table = self.boards.get(key + '.pairs')
+        if table is not None:
+            return table
+
+        board = self.board(warehouse)
+        pairs = self.read_pairs(key, len(board.cells))
+        if pairs is not None:
+            self.hits += 1
+            table = DeadlockTable(board, pairs)
+        else:
+            self.misses += 1
+            table = DeadlockTable(board)
+            store = lambda table: self.write_file(self.filename(key, '.pairs'), BoardCache.encode_pairs(table))
+            if background:
+                table.start(store)
+            else:
+                table.compute()
+                store(table)
+        self.boards.put(key + '.pairs', table)
+        return table
+
+    @staticmethod
+    def encode_pairs(table):
+        '''
+        Binary form of the dead pairs of a deadlock table.
+        '''
+        pairs = table.pairs()
+        values = array('H', [cell for pair in pairs for cell in pair])
+        header = BoardCache.PAIRS_HEADER.pack(BoardCache.PAIRS_MAGIC, BoardCache.FORMAT_VERSION, len(table.board.cells), len(pairs))
+        return header + BoardCache.little_endian(values).tobytes()
+
+    @staticmethod
+    def decode_pairs(data, n_cells):
+        '''
+        Dead pairs from their binary form, None if the data is not valid for a board of n_cells cells.
+        '''
+        if len(data) < BoardCache.PAIRS_HEADER.size:
+            return None
+        magic, version, cells, n_pairs = BoardCache.PAIRS_HEADER.unpack_from(data)
+        if magic != BoardCache.PAIRS_MAGIC or version != BoardCache.FORMAT_VERSION or cells != n_cells:
+            return None
+        values = array('H')
+        if len(data) != BoardCache.PAIRS_HEADER.size + values.itemsize * 2 * n_pairs:
+            return None
+        values.frombytes(data[BoardCache.PAIRS_HEADER.size:])
+        values = BoardCache.little_endian(values)
+        return list(zip(values[0::2], values[1::2]))
+
+    def read_pairs(self, key, n_cells):
+        '''
+        Dead pairs stored for a layout, None if there is no valid cache file.
+        '''
+        data = self.read_file(self.filename(key, '.pairs'))
+        return BoardCache.decode_pairs(data, n_cells) if data is not None else None
+
+    @staticmethod
+    def little_endian(values):
+        if sys.byteorder != 'little':
+            values = array(values.typecode, values)
+            values.byteswap()
+        return values
+
+    @staticmethod
+    def encode(board):
+        '''
+        Binary form of the precomputed values of a static board.
+        '''
+        cells = array('H', [v for cell in board.cells for v in cell])
+        taboo = array('H', [v for cell in board.taboo_cells for v in cell])
+        pushes = array('i', [d for row in board.push_distances for d in row])
+        taboo_map = board.taboo_map.encode()
+        header = BoardCache.HEADER.pack(BoardCache.MAGIC, BoardCache.FORMAT_VERSION, board.x_size, board.y_size,
+                                        len(board.cells), len(board.target_ids), len(board.taboo_cells), len(taboo_map))
+        parts = [header, taboo_map]
+        parts.extend(BoardCache.little_endian(values).tobytes() for values in (cells, taboo, board.distance_matrix, pushes))
+        return b''.join(parts)
+
+    @staticmethod
+    def decode(data):
+        '''
+        Precomputed values of a static board from their binary form (see StaticBoard), None if the data is not valid.
+        '''
+        if len(data) < BoardCache.HEADER.size:
+            return None
+        magic, version, x_size, y_size, n_cells, n_targets, n_taboo, map_len = BoardCache.HEADER.unpack_from(data)
+        if magic != BoardCache.MAGIC or version != BoardCache.FORMAT_VERSION:
+            return None
+
+        sizes = [('H', 2 * n_cells), ('H', 2 * n_taboo), ('i', n_cells * n_cells), ('i', n_cells * n_targets)]
+        offset = BoardCache.HEADER.size + map_len
+        if len(data) != offset + sum(array(typecode).itemsize * count for typecode, count in sizes):
+            return None
+
+        taboo_map = data[BoardCache.HEADER.size:offset].decode()
+        values = []
+        for typecode, count in sizes:
+            part = array(typecode)
+            part.frombytes(data[offset:offset + part.itemsize * count])
+            offset += part.itemsize * count
+            values.append(BoardCache.little_endian(part))
+        cells, taboo, distance_matrix, pushes = values
+
+        return {
+            'taboo_map': taboo_map,
+            'x_size': x_size,
+            'y_size': y_size,
+            'cells': list(zip(cells[0::2], cells[1::2])),
+            'taboo_cells': list(zip(taboo[0::2], taboo[1::2])),
+            'distance_matrix': distance_matrix,
+            'push_distances': [tuple(pushes[i:i + n_targets]) for i in range(0, len(pushes), n_targets)] if n_targets else [()] * n_cells,
+        }
+
+    def read(self, key):
+        '''
+        Precomputed values stored for a layout, None if there is no valid cache file.
+        '''
+        data = self.read_file(self.filename(key))
+        return BoardCache.decode(data) if data is not None else None
+
+    @staticmethod
+    def read_file(filename):
+        '''
+        Content of a cache file, None if it can not be read.
+        '''
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+            # Mark the file as recently used for the eviction.
+            os.utime(filename)
+        except OSError:
+            return None
+        return data
+
+    def write(self, key, board):
+        '''
+        Store the precomputed values of a board.
+        '''
+        self.write_file(self.filename(key), BoardCache.encode(board))
+
+    def write_file(self, filename, data):
+        '''
+        Write a cache file, then evict old files if the cache is too large.
+        Errors are ignored, the cache is only an optimization.
+        '''
+        temporary = '{}.{}.tmp'.format(filename, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            # Atomic, so that concurrent solvers never read a partial file.
+            os.replace(temporary, filename)
+            self.evict()
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+    def evict(self):
+        '''
+        Delete the least recently used cache files until their total size is at most max_bytes.
+        '''
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.bin'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        '''
+        Delete all the cache files and the boards kept in memory.
+        '''
+        self.boards = search.LRUCache(self.boards.maxsize)
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.bin'):
+                    os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,170 @@
+import threading
+from itertools import combinations
+
+
+class DeadlockTable:
+    '''
+    Two-box deadlock database of a board: every pair of cells where two boxes
+    can never both reach a target, whatever the position of the worker.
+
+    The table is built once per layout by a retrograde analysis of the two-box problem.
+    Starting from the states with both boxes on targets, a breadth-first search of the pulls
+    finds every (box pair, worker region) state from which the two boxes can be solved.
+    A pair of live cells that appears in none of these states is dead. Other boxes can only
+    get in the way, so a state of the real puzzle holding a dead pair is a deadlock.
+
+    The search then checks the pairs with set lookups. The table can be built in a
+    background thread (start), is_deadlock answers False until it is ready.
+
+    Example:
+        table = DeadlockTable(board)
+        table.compute()
+        table.is_dead_pair(a, b)
+    '''
+
+    def __init__(self, board, pairs=None):
+        '''
+        Parameters:
+        - board: The StaticBoard of the layout.
+        - pairs: Dead pairs of cell ids already computed (e.g. from the board cache), None to compute them.
+        '''
+        self.board = board
+        # For each cell id, the set of cells where a second box makes the pair dead (None until built).
+        self.partners = None
+        self.thread = None
+        if pairs is not None:
+            self.set_pairs(pairs)
+
+    def set_pairs(self, pairs):
+        partners = [set() for _ in self.board.cells]
+        for a, b in pairs:
+            partners[a].add(b)
+            partners[b].add(a)
+        # Assigned at the end so that a search running in another thread never sees a partial table.
+        self.partners = partners
+
+    def is_ready(self):
+        return self.partners is not None
+
+    def pairs(self):
+        '''
+        List of the dead pairs (a, b) with a < b.
+        '''
+        return [(a, b) for a, cells in enumerate(self.partners or []) for b in cells if a < b]
+
+    def is_dead_pair(self, a, b):
+        return self.partners is not None and b in self.partners[a]
+
+    def is_deadlock(self, boxes, old_box, new_box):
+        '''
+        Check if pushing a box from old_box to new_box makes a dead pair with another box.
+
+        Parameters:
+        - boxes: Cell ids of the boxes before the push (any container).
+        - old_box: Cell id of the box before the push.
+        - new_box: Cell id of the box after the push.
+
+        Returns:
+        - True if the state after the push holds a dead pair, False otherwise (or if the table is not ready).
+        '''
+        if self.partners is None:
+            return False
+        partners = self.partners[new_box]
+        if not partners:
+            return False
+        for box in boxes:
+            if box != old_box and box in partners:
+                return True
+        return False
+
+    def start(self, callback=None):
+        '''
+        Build the table in a background (daemon) thread.
+
+        Parameters:
+        - callback: Optional function called with the table once it is built.
+        '''
+        def build():
+            self.compute()
+            if callback is not None:
+                callback(self)
+
+        self.thread = threading.Thread(target=build, daemon=True)
+        self.thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        '''
+        Wait for the background build started by start().
+        '''
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.is_ready()
+
+    def region(self, worker, box_a, box_b):
+        '''
+        Cells the worker can walk to when the only boxes are on box_a and box_b.
+        '''
+        neighbours = self.board.neighbours
+        region = {worker}
+        stack = [worker]
+        while stack:
+            cell = stack.pop()
+            for neighbour in neighbours[cell]:
+                if neighbour >= 0 and neighbour != box_a and neighbour != box_b and neighbour not in region:
+                    region.add(neighbour)
+                    stack.append(neighbour)
+        return region
+
+    def compute(self):
+        '''
+        Retrograde analysis of the two-box problem (see the class description).
+
+        Returns:
+        - list: The dead pairs (a, b) with a < b.
+        '''
+        board = self.board
+        neighbours = board.neighbours
+        n_cells = len(board.cells)
+
+        # Goal states: two boxes on two targets, the worker in any free region (normalized to its minimum cell).
+        frontier = []
+        visited = set()
+        for box_a, box_b in combinations(board.target_ids, 2):
+            seen = set()
+            for cell in range(n_cells):
+                if cell == box_a or cell == box_b or cell in seen:
+                    continue
+                region = self.region(cell, box_a, box_b)
+                seen.update(region)
+                state = (box_a, box_b, min(region))
+                if state not in visited:
+                    visited.add(state)
+                    frontier.append((state, region))
+
+        solvable = set()
+        while frontier:
+            next_frontier = []
+            for (box_a, box_b, _), region in frontier:
+                solvable.add((box_a, box_b))
+                for box, other in ((box_a, box_b), (box_b, box_a)):
+                    for index in range(len(neighbours[box])):
+                        # Pull the box onto the cell next to it, the worker steps back one more cell.
+                        new_box = neighbours[box][index]
+                        if new_box < 0 or new_box not in region:
+                            continue
+                        new_worker = neighbours[new_box][index]
+                        if new_worker < 0 or new_worker == other:
+                            continue
+                        new_region = self.region(new_worker, new_box, other)
+                        pair = (new_box, other) if new_box < other else (other, new_box)
+                        state = (pair[0], pair[1], min(new_region))
+                        if state not in visited:
+                            visited.add(state)
+                            next_frontier.append((state, new_region))
+            frontier = next_frontier
+
+        live = [cell for cell in range(n_cells) if not board.is_dead[cell]]
+        pairs = [pair for pair in combinations(live, 2) if pair not in solvable]
+        self.set_pairs(pairs)
+        return pairs
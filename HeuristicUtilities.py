@@ -59,3 +59,62 @@ class HeuristicUtilities:
     def manhattan_distance(point1, point2):
         """Compute the Manhattan distance between two points."""
         return abs(point1[0] - point2[0]) + abs(point1[1] - point2[1])
+
+    @staticmethod
+    def min_cost_assignment(cost):
+        """
+        Hungarian algorithm: minimum-cost perfect matching of a square cost matrix.
+        Returns (u, v, p), the row and column potentials and the matching where p[j] is the
+        (1-based) row matched to the (1-based) column j. Entry 0 of each list is unused.
+        """
+        n = len(cost)
+        u, v, p = [0] * (n + 1), [0] * (n + 1), [0] * (n + 1)
+        for row in range(1, n + 1):
+            HeuristicUtilities.augment_assignment(cost, row, u, v, p)
+        return u, v, p
+
+    @staticmethod
+    def augment_assignment(cost, row, u, v, p):
+        """
+        Match the (1-based) free row of the cost matrix with one augmenting path, in place.
+        The potentials (u, v) must be feasible for all the other rows. This is one iteration of
+        the Hungarian algorithm, so a matching where only one row changed is repaired in O(n^2).
+        """
+        n = len(cost)
+        way = [0] * (n + 1)
+        min_reduced = [float('inf')] * (n + 1)
+        used = [False] * (n + 1)
+        p[0] = row
+        column = 0
+        while True:
+            # Grow the alternating tree from the current column.
+            used[column] = True
+            current_row = p[column]
+            costs = cost[current_row - 1]
+            u_row = u[current_row]
+            delta = float('inf')
+            next_column = 0
+            for j in range(1, n + 1):
+                if not used[j]:
+                    reduced = costs[j - 1] - u_row - v[j]
+                    if reduced < min_reduced[j]:
+                        min_reduced[j] = reduced
+                        way[j] = column
+                    if min_reduced[j] < delta:
+                        delta = min_reduced[j]
+                        next_column = j
+            # Update the potentials so that a new edge becomes tight.
+            for j in range(n + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_reduced[j] -= delta
+            column = next_column
+            if p[column] == 0:
+                break
+        # Flip the matching along the augmenting path.
+        while column:
+            previous_column = way[column]
+            p[column] = p[previous_column]
+            column = previous_column
@@ -1,42 +1,126 @@
 import math
 import Solver
-from ActionStateValidation import ActionStateValidation
+from HeuristicUtilities import HeuristicUtilities
+
+# NumPy is optional, it is only used to evaluate a batch of states at once.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class Heuristics:
+    '''
+    Two forms of every heuristic:
+      - h(board, state), a pure function of the static board and of a state given as
+        (worker_id, sorted_box_ids) (see SokobanPuzzle.state_to_ids). It never reads
+        the mutable attributes of the puzzle, so its values can be cached.
+      - heuristic(puzzle, n), the form used by Solver. It evaluates the pure heuristic
+        on the state of the node n through the bounded LRU cache of the puzzle.
+
+    Some heuristics also have a batched form heuristic_batch(puzzle, nodes) (see BATCH)
+    that evaluates all the children of an expansion in one call, with NumPy when it is installed.
+    '''
+
+    # A batch smaller than this is evaluated in Python, NumPy only pays off on larger batches.
+    NUMPY_MIN_BATCH = 4
+
     @staticmethod
-    def heur_manhattan_distance(puzzle, n):
+    def node_value(h, puzzle, n):
+        '''
+        Evaluate the pure heuristic h on the state of node n, using the puzzle's LRU cache of h-values.
+        '''
+        cache = puzzle.heuristic_cache(h)
+        value = cache.get(n.state)
+        if value is None:
+            value = h(puzzle.board, puzzle.state_to_ids(n.state))
+            cache.put(n.state, value)
+        # Only used for display (observer mode).
+        puzzle.prev_heur = value
+        return value
+
+    @staticmethod
+    def node_values(h, puzzle, nodes):
+        '''
+        Batched node_value: the values of the pure heuristic h on the states of all the nodes.
+
+        The states missing from the cache are evaluated together by the NumPy form of h
+        (see VECTORIZED) if there is one and NumPy is installed, one by one otherwise.
+        '''
+        cache = puzzle.heuristic_cache(h)
+        values = [cache.get(n.state) for n in nodes]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            states = [puzzle.state_to_ids(nodes[i].state) for i in missing]
+            vectorized = Heuristics.VECTORIZED.get(h)
+            if vectorized is not None and numpy is not None and len(states) >= Heuristics.NUMPY_MIN_BATCH:
+                new_values = vectorized(puzzle.board, states)
+            else:
+                new_values = [h(puzzle.board, state) for state in states]
+            for i, value in zip(missing, new_values):
+                values[i] = value
+                cache.put(nodes[i].state, value)
+        if values:
+            puzzle.prev_heur = values[-1]
+        return values
+
+    @staticmethod
+    def numpy_tables(board):
+        '''
+        NumPy arrays of a static board used by the vectorized heuristics, built on first use:
+        the distance matrix, the distance of each cell to its nearest target and the dead flags.
+        '''
+        if board.numpy_tables is None:
+            n_cells = len(board.cells)
+            distances = numpy.array(board.distance_matrix, dtype=numpy.int64).reshape(n_cells, n_cells)
+            nearest = distances[:, list(board.target_ids)].min(axis=1)
+            dead = numpy.array(board.is_dead, dtype=bool)
+            board.numpy_tables = distances, nearest, dead
+        return board.numpy_tables
+
+    @staticmethod
+    def h_manhattan_distance(board, state):
         '''admissible sokoban heuristic: Manhattan distance'''
-        '''INPUT: a sokoban state'''
-        '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
-        
+        _, boxes = state
         sum_distance = 0  # Initialize the sum of distances
 
-        for box in puzzle.boxes:  # Iterate through each box
+        for box in boxes:  # Iterate through each box
+            box = board.cells[box]
             closest = float('inf')  # Initialize the closest distance with infinity
 
-            for target in puzzle.targets:  # Iterate through each target
+            for target in board.targets:  # Iterate through each target
                 distance = abs(box[0] - target[0]) + abs(box[1] - target[1])  # Compute Manhattan distance
                 if distance < closest:  # Update the closest distance if a shorter distance is found
                     closest = distance
 
             sum_distance += closest  # Accumulate the sum of distances
-        global prev_heur
-        prev_heur = sum_distance
-       # print(prev_heur)
         return sum_distance  # Return the sum of distances as the heuristic value
-    
+
     @staticmethod
-    def heuristic_83_1m(puzzle, n):
-       
+    def heur_manhattan_distance(puzzle, n):
+        '''admissible sokoban heuristic: Manhattan distance'''
+        '''INPUT: a sokoban state'''
+        '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
+        return Heuristics.node_value(Heuristics.h_manhattan_distance, puzzle, n)
+
+    @staticmethod
+    def heur_manhattan_distance_batch(puzzle, nodes):
+        '''Batched heur_manhattan_distance: the values of all the nodes in one call.'''
+        return Heuristics.node_values(Heuristics.h_manhattan_distance, puzzle, nodes)
+
+    @staticmethod
+    def h_83_1m(board, state):
         """Heuristic for the Sokoban problem: sum of Manhattan distances between each box and the nearest target."""
+        worker, boxes = state
+        worker = board.cells[worker]
 
         total_distance = 0
         total_worker_box_dist = 0
         penalty_distance = 0
 
-        for box in puzzle.boxes:
+        for box in boxes:
+            box = board.cells[box]
             # Find the nearest target for this box
-            distances = [manhattan_distance(box, target) for target in puzzle.targets]
+            distances = [Heuristics.manhattan_distance(box, target) for target in board.targets]
             nearest_distance = min(distances) if distances else 0
             total_distance += nearest_distance
 
@@ -44,55 +128,175 @@ class Heuristics:
             penalty_distance += nearest_distance * nearest_distance  # Using square of the distance as penalty
 
             # Distance from worker to the box
-            worker_box_dist = manhattan_distance(box, puzzle.worker)
+            worker_box_dist = Heuristics.manhattan_distance(box, worker)
             total_worker_box_dist += worker_box_dist
         total_worker_box_dist *= 3
         total_distance *= total_distance
        # penalty_distance *= 0.4
-        puzzle.prev_heur = sum_h = total_distance + penalty_distance - total_worker_box_dist 
-        return sum_h  
+        return total_distance + penalty_distance - total_worker_box_dist
 
     @staticmethod
-    def heuristic83Lookup(puzzle, n):
-      
+    def heuristic_83_1m(puzzle, n):
         """Heuristic for the Sokoban problem: sum of Manhattan distances between each box and the nearest target."""
+        return Heuristics.node_value(Heuristics.h_83_1m, puzzle, n)
+
+    @staticmethod
+    def h_83_lookup(board, state):
+        """Heuristic for the Sokoban problem: sum of walking distances between each box and the nearest target."""
+        worker_id, boxes = state
 
         total_distance = 0
         total_worker_box_dist = 0
         penalty_distance = 0
 
-        for box in puzzle.boxes:
-            distances_list = []  # List to hold distances for each target
-
-            # Find the nearest target for this box
-            for target in puzzle.targets:
-                sorted_positions = tuple(sorted([box, target])) 
-                distances = puzzle.lookup_table.get(sorted_positions)
-
-                if isinstance(distances, int):
-                    distances = [distances]
+        # Distances are read from the dense distance matrix of the static board.
+        n_cells = len(board.cells)
 
-                # Instead of getting the minimum distance here, just append it to distances_list
-                distances_list.append(min(distances) if distances else 0)
+        for box_id in boxes:
+            # A box on a dead square can never reach a target.
+            if board.is_dead[box_id]:
+                return float('inf')
 
-            nearest_distance = min(distances_list)  # Get the nearest distance after considering all targets
+            # Find the nearest target for this box
+            row = box_id * n_cells
+            nearest_distance = min(board.distance_matrix[row + target_id] for target_id in board.target_ids)
             total_distance += nearest_distance
 
             # Apply penalty based on the distance to the nearest target
             penalty_distance += nearest_distance * nearest_distance  # Using square of the distance as penalty
 
             # Distance from worker to the box
-            sorted_positions = tuple(sorted([box, puzzle.worker])) 
-            worker_box_dist = puzzle.lookup_table.get(sorted_positions)
+            worker_box_dist = board.distance_matrix[row + worker_id]
 
             total_worker_box_dist += worker_box_dist
 
         total_worker_box_dist *= 3
         total_distance *= total_distance
 
-        puzzle.prev_heur = sum_h = total_distance + penalty_distance - total_worker_box_dist 
+        return total_distance + penalty_distance - total_worker_box_dist
+
+    @staticmethod
+    def h_83_lookup_numpy(board, states):
+        """
+        h_83_lookup of a list of states with the same number of boxes, vectorized with NumPy:
+        the nearest target distances and the worker distances of all the boxes are gathered
+        from the board arrays in one indexing operation, then reduced per state.
+        """
+        distances, nearest, dead = Heuristics.numpy_tables(board)
+        workers = numpy.array([worker for worker, _ in states])
+        boxes = numpy.array([boxes for _, boxes in states])
+
+        box_distances = nearest[boxes]
+        total_distance = box_distances.sum(axis=1)
+        penalty_distance = (box_distances * box_distances).sum(axis=1)
+        total_worker_box_dist = distances[boxes, workers[:, None]].sum(axis=1)
+        values = (total_distance * total_distance + penalty_distance - 3 * total_worker_box_dist).tolist()
+
+        # A box on a dead square can never reach a target.
+        for i in numpy.flatnonzero(dead[boxes].any(axis=1)).tolist():
+            values[i] = float('inf')
+        return values
+
+    @staticmethod
+    def heuristic83Lookup(puzzle, n):
+        """Heuristic for the Sokoban problem: sum of walking distances between each box and the nearest target."""
+        return Heuristics.node_value(Heuristics.h_83_lookup, puzzle, n)
+
+    @staticmethod
+    def heuristic83Lookup_batch(puzzle, nodes):
+        """Batched heuristic83Lookup: the values of all the nodes in one call."""
+        return Heuristics.node_values(Heuristics.h_83_lookup, puzzle, nodes)
+
+    @staticmethod
+    def h_matching(board, state):
+        '''
+        Admissible sokoban heuristic: minimum-cost perfect matching between boxes and targets.
+
+        Every box gets its own target (Hungarian algorithm) using the push distances of the
+        static board, so several boxes can no longer claim the same nearest target.
+
+        OUTPUT: the minimum total number of pushes, or infinity if the boxes cannot all reach a target.
+        '''
+        return Heuristics.matching_value(board, Heuristics.box_matching(board, state))
+
+    @staticmethod
+    def box_matching(board, state, parent_matching=None):
+        '''
+        Compute the matching used by h_matching: (box id of each row, row potentials,
+        column potentials, row of each column), or None if a box is on a dead square.
+
+        When only one box moved since the state of parent_matching, that matching is repaired
+        with a single augmenting path instead of being rebuilt. The optimal cost does not
+        depend on this, only the time needed to find it.
+        '''
+        _, boxes = state
+
+        # A box on a dead square can never reach a target.
+        for box in boxes:
+            if board.is_dead[box]:
+                return None
+
+        matching = parent_matching
+
+        if matching is not None:
+            rows = matching[0]
+            box_set = set(boxes)
+            moved_from = [row for row, box in enumerate(rows) if box not in box_set]
+
+            if len(moved_from) == 1:
+                # Only one box moved: replace its row and repair the matching.
+                row = moved_from[0]
+                row_set = set(rows)
+                rows = list(rows)
+                rows[row] = next(box for box in boxes if box not in row_set)
+                u, v, p = list(matching[1]), list(matching[2]), list(matching[3])
+                p[p.index(row + 1, 1)] = 0
+                cost = [board.push_distances[box] for box in rows]
+                HeuristicUtilities.augment_assignment(cost, row + 1, u, v, p)
+                matching = (tuple(rows), u, v, p)
+            elif moved_from:
+                # Several boxes moved, rebuild the matching.
+                matching = None
+
+        if matching is None:
+            cost = [board.push_distances[box] for box in boxes]
+            matching = (boxes,) + HeuristicUtilities.min_cost_assignment(cost)
+
+        return matching
+
+    @staticmethod
+    def matching_value(board, matching):
+        '''
+        Total number of pushes of a matching computed by box_matching (infinity for no matching).
+        '''
+        if matching is None:
+            return float('inf')
+        rows, _, _, p = matching
+        sum_h = sum(board.push_distances[rows[p[j] - 1]][j - 1] for j in range(1, len(p)))
+        if sum_h >= board.NO_PATH:
+            return float('inf')
         return sum_h
 
+    @staticmethod
+    def heuristic_matching(puzzle, n):
+        '''
+        Admissible sokoban heuristic: minimum-cost perfect matching between boxes and targets (see h_matching).
+
+        The matching is kept on the node. When only one box moved since the parent node,
+        the parent's matching is repaired incrementally instead of being rebuilt.
+
+        INPUT: a sokoban state
+        OUTPUT: the minimum total number of pushes, or infinity if the boxes cannot all reach a target.
+        '''
+        cache = puzzle.heuristic_cache(Heuristics.h_matching)
+        value = cache.get(n.state)
+        if value is None:
+            parent_matching = getattr(n.parent, 'matching', None) if n.parent else None
+            n.matching = Heuristics.box_matching(puzzle.board, puzzle.state_to_ids(n.state), parent_matching)
+            value = Heuristics.matching_value(puzzle.board, n.matching)
+            cache.put(n.state, value)
+        puzzle.prev_heur = value
+        return value
 
     @staticmethod
     def modified_distance(puzzle, point1, point2):
@@ -114,139 +318,98 @@ class Heuristics:
         return x_val + y_val  # Return the sum of modified distances
 
     @staticmethod
-    def combined_heuristic(puzzle, n):  
-       
-        '''admissible sokoban heuristic: Manhattan distance'''
-        '''INPUT: a sokoban state'''
-        '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
-
-        if puzzle.prev_heur is None:
-            puzzle.prev_heur = float("inf")
-            return puzzle.prev_heur
-        #print("heuris")
-       # state = n.state
-
-        worker, boxes = n.state
+    def h_combined(board, state):
+        '''sokoban heuristic: modified distance of the boxes to the targets plus worker to box distances'''
+        worker, boxes = state
+        worker = board.cells[worker]
 
         # Initial distances
-        sum_distance = 0
-        total_worker_box_dist = 0 
+        total_worker_box_dist = 0
         modified_sum_distance = 0
 
         # Calculate distances for each box
         for box in boxes:
-            manhattan_closest = float('inf')
+            box = board.cells[box]
             modified_closest = float('inf')
 
-            for target in puzzle.targets:
-                # Manhattan distance
-               # manhattan_dist = abs(box[0] - target[0]) + abs(box[1] - target[1])
-
-    #             if manhattan_dist < manhattan_closest:
-    #                 manhattan_closest = manhattan_dist
-
+            for target in board.targets:
                 # Modified distance
-                mod_dist = modified_distance(box, target)
+                mod_dist = Heuristics.modified_distance(board, box, target)
                 if mod_dist < modified_closest:
                     modified_closest = mod_dist
 
-            sum_distance += manhattan_closest
             modified_sum_distance += modified_closest
 
             # Consider distance between worker and box if the box is not on target
-            if box not in puzzle.targets:
-                worker_box_dist = manhattan_distance(box, worker)
+            if box not in board.targets:
+                worker_box_dist = Heuristics.manhattan_distance(box, worker)
                 total_worker_box_dist += worker_box_dist
 
         # Combine the heuristics
-        combined_value =   modified_sum_distance + total_worker_box_dist
+        return modified_sum_distance + total_worker_box_dist
 
-        return combined_value
+    @staticmethod
+    def combined_heuristic(puzzle, n):
+        '''sokoban heuristic: modified distance of the boxes to the targets plus worker to box distances'''
+        '''INPUT: a sokoban state'''
+        '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
+        return Heuristics.node_value(Heuristics.h_combined, puzzle, n)
 
     @staticmethod
-    def heuristic_estimate(puzzle, n):
+    def h_estimate(board, state):
         '''
-        This heuristic calculates an estimate for the Sokoban problem based on the modified Manhattan distance. 
-        It takes into consideration the distance of boxes to their respective targets and also penalizes 
-        certain conditions to make the heuristic more informative. 
-
-        Additionally, the heuristic periodically checks if any box is in a "stuck" or "deadlock" state, 
-        meaning it cannot reach its target due to other obstructions or boxes. If a box is identified in 
-        such a state, the heuristic returns an infinite cost, indicating that the current state is undesirable.
-
-        INPUT: A Sokoban state 'n'
-        OUTPUT: A numeric value estimating the distance of the state to the goal.
+        This heuristic calculates an estimate for the Sokoban problem based on the walking distances
+        of the static board. It takes into consideration the distance of boxes to their respective targets
+        and the distance of the worker to the boxes that are not on a target.
         '''
-        ... 
-        # If there is no previous heuristic value, set it to infinity
-        if puzzle.prev_heur is None:
-            puzzle.prev_heur = float("inf")
-            return puzzle.prev_heur
-
-        state = n.state
-        worker, boxes = state
+        worker_id, boxes = state
 
         sum_distance = 0  # Initialize the sum of distances
         total_worker_box_dist = 0
 
-        sum_benefit = 0
-        penalty_distance = 0
-        for box in puzzle.boxes:
+        # Distances are read from the dense distance matrix of the static board.
+        n_cells = len(board.cells)
+
+        for box_id in boxes:
+            # A box on a dead square can never reach a target.
+            if board.is_dead[box_id]:
+                return float('inf')
+
             closest = float('inf')
-            for target in puzzle.targets:
+            row = box_id * n_cells
+            for target_id in board.target_ids:
                 # If the box is already on a target, skip the calculations
-                if box == target:
+                if box_id == target_id:
                     continue
-                sorted_positions = tuple(sorted([box, target])) 
-
-                # Retrieve the distance from the lookup table
-                distance = puzzle.lookup_table.get(sorted_positions)
 
-                # If the distance isn't in the lookup table, compute using the Manhattan distance
-                if distance is None:
-                    distance = manhattan_distance(box, target)
+                # Retrieve the distance from the distance matrix
+                distance = board.distance_matrix[row + target_id]
 
                 if distance < closest:
                     closest = distance
             sum_distance += closest * 2
 
-            if box not in puzzle.targets: 
-                sorted_positions = tuple(sorted([box, puzzle.worker]))  
-
-                # Retrieve the distance between the worker and the box from the lookup table
-                worker_box_dist = puzzle.lookup_table.get(sorted_positions)
-
-                # If the distance isn't in the lookup table, compute using the Manhattan distance
-                if worker_box_dist is None:
-                    worker_box_dist = manhattan_distance(box, puzzle.worker)
+            if not board.is_target[box_id]:
+                # Retrieve the distance between the worker and the box from the distance matrix
+                worker_box_dist = board.distance_matrix[row + worker_id]
 
                 total_worker_box_dist += worker_box_dist
 
-        puzzle.heuristic_count += 1
-        stucked_box = 0
-
-        # If heuristic count exceeds 10,000, reset it and check certain conditions
-        if puzzle.heuristic_count >= 10000:
-            puzzle.heuristic_count = 0
-
-            # Check if a box cannot reach any target. If true, set the heuristic to infinity
-            if ActionStateValidation.check_box_can_go_target(puzzle.walls, puzzle.targets, boxes) == False: 
-                puzzle.prev_heur = stucked_box =  float('inf')
-                puzzle.box_can_not_go_target_count += 1
-                return stucked_box
+        # Sum the computed distances to get the final heuristic value
+        return sum_distance + total_worker_box_dist
 
-            # Check if boxes are in a stuck configuration outside of a warehouse. If true, set heuristic to infinity
-            if ActionStateValidation.check_stucked_case_no_warehouse(puzzle, boxes): 
-                puzzle.stucked_case_count += 1
-                puzzle.prev_heur = stucked_box =  float('inf')
-                return stucked_box
+    @staticmethod
+    def heuristic_estimate(puzzle, n):
+        '''
+        This heuristic calculates an estimate for the Sokoban problem (see h_estimate).
 
-        # Sum the computed distances and penalties to get the final heuristic value
-        puzzle.prev_heur = sum_h = sum_distance + total_worker_box_dist  + penalty_distance
+        Deadlocked states are not scored here: the pushes that freeze a box off target are
+        pruned by SokobanPuzzle when the successors are generated (see ActionStateValidation.is_freeze_deadlock).
 
-        # For debugging: If the heuristic is negative, print the components
-        if sum_h < 0:
-            print(sum_distance, total_worker_box_dist,stucked_box,"sum_distance + total_worker_box_dist  + stucked_box" )
+        INPUT: A Sokoban state 'n'
+        OUTPUT: A numeric value estimating the distance of the state to the goal.
+        '''
+        sum_h = Heuristics.node_value(Heuristics.h_estimate, puzzle, n)
 
         return sum_h
 
@@ -256,12 +419,14 @@ class Heuristics:
         """Compute the Manhattan distance between two points."""
         return abs(point1[0] - point2[0]) + abs(point1[1] - point2[1])
 
-     
-
-
-    
-
 
-    
+# Batched form of the node heuristics, used by the searches to evaluate all the children of an expansion at once.
+Heuristics.BATCH = {
+    Heuristics.heuristic83Lookup: Heuristics.heuristic83Lookup_batch,
+    Heuristics.heur_manhattan_distance: Heuristics.heur_manhattan_distance_batch,
+}
 
-    
+# NumPy form of the pure heuristics, h(board, list of states) -> list of values.
+Heuristics.VECTORIZED = {
+    Heuristics.h_83_lookup: Heuristics.h_83_lookup_numpy,
+}
@@ -0,0 +1,367 @@
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+from sokoban import Warehouse
+
+
+class LevelCollection:
+    '''
+    Streaming reader of multi-level collection files (XSB / SOK).
+
+    A collection is a text file of levels separated by blank lines, comments (lines starting
+    with ';') and metadata lines ('Title: ...', 'Author: ...'). The file is read line by line
+    and the levels are yielded one at a time, so a collection of any size is read in the
+    memory of one level. Each level is parsed in a single pass over its characters.
+
+    Level characters: '#' wall, '$' box, '.' target, '*' box on target, '@' worker, '+' (or '!')
+    worker on target, ' ', '-' or '_' floor. Run-length encoded rows ('4#|#@$.#') are expanded.
+
+    Example:
+        for title, warehouse in LevelCollection.levels('Microban.xsb'):
+            answer = Solver.solve_sokoban_macro(warehouse, push_level=True)
+    '''
+
+    LEVEL_CHARS = frozenset('#@+!$*.-_ 0123456789|')
+    RUN_LENGTH = re.compile(r'(\d+)(\D)')
+
+    @staticmethod
+    def is_level_line(line):
+        '''
+        True if the line is a row of a level (only level characters, with at least one wall).
+        '''
+        return '#' in line and all(char in LevelCollection.LEVEL_CHARS for char in line)
+
+    @staticmethod
+    def expand_rows(line):
+        '''
+        Rows of a level line, the run-length encoding expanded ('|' separates rows).
+        '''
+        if not any(char.isdigit() or char == '|' for char in line):
+            return [line]
+        line = LevelCollection.RUN_LENGTH.sub(lambda match: match.group(2) * int(match.group(1)), line)
+        return line.split('|')
+
+    @staticmethod
+    def parse(lines):
+        '''
+        Split an iterable of text lines into levels.
+
+        Yields:
+        - tuple: (title, rows) for each level, the title being the 'Title:' metadata after the
+                 level, else a comment on the line right after its rows, else the last comment
+                 before it, else None. Collections put the title comment either before or after
+                 the level, a comment after a level only names it when nothing separates them.
+        '''
+        rows = []
+        comment = None
+        level = None  # The level read last, yielded when its metadata has been read.
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if LevelCollection.is_level_line(line):
+                if not rows and level is not None:
+                    yield level
+                    level = None
+                rows.extend(LevelCollection.expand_rows(line))
+                continue
+            text = line.strip()
+            if rows:
+                level = [comment, rows]
+                rows, comment = [], None
+                if text.startswith(';') and text[1:].strip():
+                    # The comment right after the rows is the title of the level, not of the next one.
+                    level[0] = text[1:].strip()
+                    continue
+            if text.startswith(';'):
+                comment = text[1:].strip() or comment
+            elif text.lower().startswith('title:') and level is not None:
+                level[0] = text[len('title:'):].strip()
+        if rows:
+            if level is not None:
+                yield tuple(level)
+            level = [comment, rows]
+        if level is not None:
+            yield tuple(level)
+
+    # Collections checked by check_parser: (text, expected titles).
+    PARSER_CHECKS = [
+        # Title comments before the levels.
+        ('; Level A\n#####\n#@$.#\n#####\n\n; Level B\n#####\n#.$@#\n#####\n', ['Level A', 'Level B']),
+        # Title comments after the levels.
+        ('#####\n#@$.#\n#####\n; Level A\n\n#####\n#.$@#\n#####\n; Level B\n', ['Level A', 'Level B']),
+        # 'Title:' metadata after the levels, a collection comment before the first level.
+        ('; Collection\n\n#####\n#@$.#\n#####\nTitle: Level A\n\n#####\n#.$@#\n#####\nTitle: Level B\n',
+         ['Level A', 'Level B']),
+        # No title, run-length encoded rows.
+        ('5#|#@$.#|5#\n', [None]),
+    ]
+
+    @staticmethod
+    def check_parser():
+        '''
+        Parse the collections of PARSER_CHECKS (both title conventions).
+
+        Returns:
+        - list: Description of each collection parsed wrongly (empty if there is none).
+        '''
+        failures = []
+        for text, expected in LevelCollection.PARSER_CHECKS:
+            levels = list(LevelCollection.parse(text.splitlines(True)))
+            titles = [title for title, _ in levels]
+            if titles != expected or any(len(rows) != 3 for _, rows in levels):
+                failures.append('{!r}: titles {} (expected {})'.format(text, titles, expected))
+        return failures
+
+    @staticmethod
+    def warehouse(rows):
+        '''
+        Warehouse of the rows of a level, shifted so that row 0 and column 0 have a wall
+        (the canonical form of Warehouse.load_warehouse).
+        '''
+        rows = [row for row in rows if '#' in row]
+        if not rows:
+            raise ValueError('Warehouse with no walls!')
+        first_column = min(row.find('#') for row in rows)
+
+        walls, boxes, targets, workers = [], [], [], []
+        for y, row in enumerate(rows):
+            for x, char in enumerate(row[first_column:]):
+                if char == '#':
+                    walls.append((x, y))
+                elif char == '$':
+                    boxes.append((x, y))
+                elif char == '.':
+                    targets.append((x, y))
+                elif char == '*':
+                    boxes.append((x, y))
+                    targets.append((x, y))
+                elif char == '@':
+                    workers.append((x, y))
+                elif char == '+' or char == '!':
+                    workers.append((x, y))
+                    targets.append((x, y))
+        if len(workers) != 1:
+            raise ValueError('Warehouse with {} workers'.format(len(workers)))
+        if len(boxes) != len(targets):
+            raise ValueError('Warehouse with {} boxes and {} targets'.format(len(boxes), len(targets)))
+
+        warehouse = Warehouse()
+        warehouse.worker = workers[0]
+        warehouse.boxes = boxes
+        warehouse.targets = targets
+        warehouse.walls = walls
+        return warehouse
+
+    @staticmethod
+    def levels(path):
+        '''
+        Yields the (title, warehouse) pairs of a collection file, reading it lazily.
+        Levels without a title are named by their number in the file (from 1).
+        '''
+        with open(path, 'r') as f:
+            for number, (title, rows) in enumerate(LevelCollection.parse(f), 1):
+                yield title or str(number), LevelCollection.warehouse(rows)
+
+    @staticmethod
+    def warehouses(path):
+        '''
+        Yields the warehouses of a collection file, reading it lazily.
+        '''
+        for _, warehouse in LevelCollection.levels(path):
+            yield warehouse
+
+
+class LevelCorpus:
+    '''
+    Compact binary corpus of levels, read through a memory map.
+
+    The file holds a header, one record per level and an index of the record offsets at the end,
+    so level n is read with two lookups whatever the size of the corpus, without parsing the
+    other levels. A record is the width, height and title of the level followed by its cells,
+    4 bits per cell (see CELL_CODES).
+
+    Example:
+        LevelCorpus.build('corpus.sokc', ['Microban.xsb', 'Sasquatch.sok'])
+        with LevelCorpus('corpus.sokc') as corpus:
+            warehouse = corpus[1234]
+    '''
+
+    FORMAT_VERSION = 1
+    MAGIC = b'SOKC'
+
+    # magic, version, number of levels, offset of the index
+    HEADER = struct.Struct('<4sIQQ')
+    # width, height, length of the title (each at most MAX_FIELD)
+    RECORD = struct.Struct('<HHH')
+    MAX_FIELD = 0xFFFF
+    OFFSET = struct.Struct('<Q')
+
+    CELL_CODES = {' ': 0, '#': 1, '$': 2, '.': 3, '*': 4, '@': 5, '+': 6}
+
+    def __init__(self, path):
+        '''
+        Parameters:
+        - path: Corpus file written by build.
+        '''
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < LevelCorpus.HEADER.size:
+            self.close()
+            raise ValueError('{} is not a level corpus'.format(path))
+        magic, version, self.count, self.index_offset = LevelCorpus.HEADER.unpack_from(self.data)
+        if magic != LevelCorpus.MAGIC or version != LevelCorpus.FORMAT_VERSION:
+            self.close()
+            raise ValueError('{} is not a level corpus (version {})'.format(path, LevelCorpus.FORMAT_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def record(self, index):
+        '''
+        (title, width, height, offset of the cells) of level index.
+        '''
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('level index out of range')
+        offset, = LevelCorpus.OFFSET.unpack_from(self.data, self.index_offset + index * LevelCorpus.OFFSET.size)
+        width, height, title_length = LevelCorpus.RECORD.unpack_from(self.data, offset)
+        offset += LevelCorpus.RECORD.size
+        title = self.data[offset:offset + title_length].decode()
+        return title, width, height, offset + title_length
+
+    def title(self, index):
+        return self.record(index)[0]
+
+    def __getitem__(self, index):
+        '''
+        Warehouse of level index.
+        '''
+        _, width, height, offset = self.record(index)
+        cells = self.data[offset:offset + (width * height + 1) // 2]
+
+        walls, boxes, targets = [], [], []
+        worker = None
+        for i in range(width * height):
+            code = cells[i >> 1] >> 4 if i & 1 == 0 else cells[i >> 1] & 15
+            if code == 0:
+                continue
+            cell = (i % width, i // width)
+            if code == 1:
+                walls.append(cell)
+            elif code == 2:
+                boxes.append(cell)
+            elif code == 3:
+                targets.append(cell)
+            elif code == 4:
+                boxes.append(cell)
+                targets.append(cell)
+            else:
+                worker = cell
+                if code == 6:
+                    targets.append(cell)
+
+        warehouse = Warehouse()
+        warehouse.worker = worker
+        warehouse.boxes = boxes
+        warehouse.targets = targets
+        warehouse.walls = walls
+        return warehouse
+
+    @staticmethod
+    def encode(title, warehouse):
+        '''
+        Binary record of a level.
+        Raises a ValueError if the level or its title is too large for a record.
+        '''
+        width = 1 + max(x for x, y in warehouse.walls)
+        height = 1 + max(y for x, y in warehouse.walls)
+        encoded_title = title.encode()
+        for field, value in (('width', width), ('height', height), ('title length', len(encoded_title))):
+            if value > LevelCorpus.MAX_FIELD:
+                raise ValueError('level {!r}: {} {} is over {}'.format(
+                    title if len(title) <= 80 else title[:77] + '...', field, value, LevelCorpus.MAX_FIELD))
+        codes = LevelCorpus.CELL_CODES
+        grid = bytearray(width * height + 1)
+        for x, y in warehouse.walls:
+            grid[y * width + x] = codes['#']
+        for x, y in warehouse.targets:
+            grid[y * width + x] = codes['.']
+        for x, y in warehouse.boxes:
+            grid[y * width + x] = codes['*'] if grid[y * width + x] == codes['.'] else codes['$']
+        x, y = warehouse.worker
+        grid[y * width + x] = codes['+'] if grid[y * width + x] == codes['.'] else codes['@']
+
+        packed = bytes(grid[i] << 4 | grid[i + 1] for i in range(0, width * height, 2))
+        return LevelCorpus.RECORD.pack(width, height, len(encoded_title)) + encoded_title + packed
+
+    @staticmethod
+    def build(path, collection_files):
+        '''
+        Write the corpus of the levels of collection files (streamed, the index is kept in memory).
+
+        Returns:
+        - int: The number of levels written.
+        '''
+        offsets = array('Q')
+        with open(path, 'wb') as f:
+            f.write(bytes(LevelCorpus.HEADER.size))
+            for collection_file in collection_files:
+                name = os.path.splitext(os.path.basename(collection_file))[0]
+                for title, warehouse in LevelCollection.levels(collection_file):
+                    offsets.append(f.tell())
+                    f.write(LevelCorpus.encode('{}/{}'.format(name, title), warehouse))
+            index_offset = f.tell()
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+            f.write(offsets.tobytes())
+            # The header is written last, a corpus interrupted while building is not valid.
+            f.seek(0)
+            f.write(LevelCorpus.HEADER.pack(LevelCorpus.MAGIC, LevelCorpus.FORMAT_VERSION, len(offsets), index_offset))
+        return len(offsets)
+
+    @staticmethod
+    def main(argv=None):
+        '''
+        Command line entry point: build a corpus from collection files.
+        '''
+        parser = argparse.ArgumentParser(description='Build a binary level corpus from XSB/SOK collection files.')
+        parser.add_argument('collections', nargs='*', help='collection files')
+        parser.add_argument('--output', help='corpus file to write')
+        parser.add_argument('--check-parser', action='store_true',
+                            help='only check the collection parser on the bundled examples')
+        args = parser.parse_args(argv)
+
+        if args.check_parser:
+            failures = LevelCollection.check_parser()
+            for failure in failures:
+                print('FAILED', failure)
+            print('{} parser check(s) failed'.format(len(failures)))
+            return 1 if failures else 0
+        if not args.collections or not args.output:
+            parser.error('collection files and --output are required')
+
+        count = LevelCorpus.build(args.output, args.collections)
+        print('{} levels written to {}'.format(count, args.output), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(LevelCorpus.main())
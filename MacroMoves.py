@@ -0,0 +1,169 @@
+from collections import deque
+
+
+class MacroMoves:
+    '''
+    Macro pushes of the push-level search, found from the static board.
+
+    - Tunnels: once a box is pushed into a one-wide corridor with the worker behind it,
+      the box can only be pushed further along the corridor, so the pushes are chained
+      until the box leaves the tunnel (or stops on a target or in front of an obstacle).
+    - Goal room: when all the targets are in a room that the boxes can only enter through
+      a single entrance cell, the order in which the targets can be filled (deepest first)
+      and the pushes that bring a box from the entrance to each target are precomputed.
+      A box pushed onto the entrance is then taken to its target in one action.
+
+    A macro action is a tuple of (box cell id, action index) pushes of the same box.
+    '''
+
+    def __init__(self, board):
+        '''
+        Parameters:
+        - board: The StaticBoard of the layout.
+        '''
+        self.board = board
+        self.n_actions = len(board.ACTIONS)
+        # Action indices of the directions across each direction (Up/Down for Left/Right and the reverse).
+        self.across = [tuple(i for i in range(self.n_actions) if i != index and i != board.opposite_actions[index])
+                       for index in range(self.n_actions)]
+
+        # Goal room: its cells, the entrance, the outside cell in front of the entrance, the direction
+        # from that cell into the room, the targets in filling order and the pushes filling each target.
+        self.room = frozenset()
+        self.entrance = self.outside = self.direction = None
+        self.packing = []
+        self.packing_pushes = []
+        self.find_goal_room()
+
+    def is_tunnel(self, cell, index):
+        '''
+        True if the cell has a wall on both sides across the direction of action index.
+        '''
+        neighbours = self.board.neighbours[cell]
+        return all(neighbours[side] < 0 for side in self.across[index])
+
+    def tunnel_continues(self, box, index):
+        '''
+        True if a box just pushed onto cell 'box' in the direction of action index is in a tunnel,
+        with the worker in the tunnel behind it, and off target: the box has to be pushed further.
+        '''
+        worker = self.board.neighbours[box][self.board.opposite_actions[index]]
+        return not self.board.is_target[box] and self.is_tunnel(box, index) and self.is_tunnel(worker, index)
+
+    def region(self, worker, boxes, allowed):
+        '''
+        Cells of 'allowed' the worker can walk to without pushing any box.
+        '''
+        region = {worker}
+        stack = [worker]
+        while stack:
+            cell = stack.pop()
+            for neighbour in self.board.neighbours[cell]:
+                if neighbour in allowed and neighbour not in boxes and neighbour not in region:
+                    region.add(neighbour)
+                    stack.append(neighbour)
+        return region
+
+    def box_path(self, box, worker, goal, boxes, allowed):
+        '''
+        Breadth-first search of the pushes bringing one box to goal, the other boxes staying in place.
+
+        Parameters:
+        - box, worker, goal: Cell ids of the box, of the worker and of the goal of the box.
+        - boxes: Cell ids of the other boxes.
+        - allowed: Cells the worker and the box may use.
+
+        Returns:
+        - list: The (box cell id, action index) pushes, None if there is no path.
+        '''
+        neighbours = self.board.neighbours
+        start = (box, min(self.region(worker, boxes | {box}, allowed)))
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            state = queue.popleft()
+            box, worker = state
+            if box == goal:
+                pushes = []
+                while parents[state] is not None:
+                    state, push = parents[state]
+                    pushes.append(push)
+                pushes.reverse()
+                return pushes
+            region = self.region(worker, boxes | {box}, allowed)
+            for index in range(self.n_actions):
+                behind = neighbours[box][self.board.opposite_actions[index]]
+                new_box = neighbours[box][index]
+                if behind not in region or new_box not in allowed or new_box in boxes:
+                    continue
+                new_state = (new_box, min(self.region(box, boxes | {new_box}, allowed)))
+                if new_state not in parents:
+                    parents[new_state] = (state, (box, index))
+                    queue.append(new_state)
+        return None
+
+    def find_goal_room(self):
+        '''
+        Look for the smallest room holding all the targets behind a single entrance cell,
+        and precompute the filling order of its targets. Nothing is set if there is none.
+        '''
+        board = self.board
+        n_cells = len(board.cells)
+        targets = set(board.target_ids)
+        all_cells = set(range(n_cells))
+
+        best = None
+        for entrance in range(n_cells):
+            if entrance in targets:
+                continue
+            # The cells on the targets' side of the entrance.
+            room = self.region(board.target_ids[0], {entrance}, all_cells)
+            if not targets <= room or len(room) + 1 >= n_cells:
+                continue
+            # The entrance must have one neighbour outside, in line with one neighbour in the room.
+            outside = [cell for cell in board.neighbours[entrance] if cell >= 0 and cell not in room]
+            if len(outside) != 1:
+                continue
+            index = board.neighbours[outside[0]].index(entrance)
+            if board.neighbours[entrance][index] not in room:
+                continue
+            if best is None or len(room) < len(best[0]):
+                best = (room, entrance, outside[0], index)
+
+        if best is None:
+            return
+        room, entrance, outside, index = best
+
+        # Fill the deepest targets first, checking that every box can still be brought in.
+        allowed = room | {entrance, outside}
+        depth = board.distance_matrix[entrance * n_cells:(entrance + 1) * n_cells]
+        packing, packing_pushes = [], []
+        remaining = set(targets)
+        while remaining:
+            for target in sorted(remaining, key=lambda cell: -depth[cell]):
+                pushes = self.box_path(entrance, outside, target, set(packing), allowed)
+                if pushes is not None:
+                    break
+            else:
+                return
+            packing.append(target)
+            packing_pushes.append(tuple(pushes))
+            remaining.discard(target)
+
+        self.room, self.entrance, self.outside, self.direction = room, entrance, outside, index
+        self.packing, self.packing_pushes = packing, packing_pushes
+
+    def room_pushes(self, boxes):
+        '''
+        Pushes bringing a box from the entrance to the next target of the goal room.
+
+        Parameters:
+        - boxes: Cell ids of the boxes, with one box on the entrance.
+
+        Returns:
+        - tuple: The pushes, None if the boxes in the room are not the targets filled so far.
+        '''
+        filled = [box for box in boxes if box in self.room]
+        if len(filled) >= len(self.packing) or set(filled) != set(self.packing[:len(filled)]):
+            return None
+        return self.packing_pushes[len(filled)]
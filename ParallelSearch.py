@@ -0,0 +1,338 @@
+"""
+Hash-distributed parallel best-first search (HDA*).
+
+Each worker process owns the states whose hash maps to it: it keeps the open list and the
+best path cost of its own states only. A worker expands its best open node and sends every
+child to the owner of the child, the children for the same owner being sent together in one
+message per expansion round. The search ends when a goal is found (greedy search) or when no
+worker has a node better than the best goal found and no message is in flight (A*).
+The solution path is then rebuilt by asking the owner of each state for its parent.
+
+The workers are forked, so the problem and the heuristic are shared with them without being
+pickled. A worker that fails sends its traceback, and the calling process raises a RuntimeError
+as soon as it gets it or sees that a worker has exited. Where fork is not available, or from a daemonic process (which can not have children,
+e.g. a BatchSolver worker), the sequential search of search.py is used instead.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import traceback
+
+import search
+
+# Number of nodes a worker expands before it sends the children it generated.
+EXPANSION_ROUND = 16
+
+# Seconds a worker with an empty open list waits for a message before checking the flags again.
+POLL_INTERVAL = 0.005
+
+
+def parallel_astar_search(problem, h=None, stats=None, workers=None, **options):
+    """
+    Hash-distributed A*: f(n) = g(n)+h(n). The solution has the lowest path cost if h is admissible.
+    Same arguments as search.astar_graph_search, plus the number of worker processes
+    (default: number of cores).
+    """
+    return hash_distributed_search(problem, h or problem.h, False, stats, workers, **options)
+
+
+def parallel_best_first_search(problem, h=None, stats=None, workers=None, **options):
+    """
+    Hash-distributed greedy best-first search: f(n) = h(n), the first goal found is returned.
+    """
+    return hash_distributed_search(problem, h or problem.h, True, stats, workers, **options)
+
+
+def hash_distributed_search(problem, h, greedy, stats=None, workers=None, time_limit=None, node_limit=None,
+                            memory_limit=None, explored=None):
+    """
+    Run the hash-distributed search (see the module description).
+
+    Parameters:
+    - problem: The search problem (states must hash the same way in every process).
+    - h: Heuristic h(node). If h has a 'batch' attribute, h.batch(nodes) evaluates the nodes
+         received in one message together.
+    - greedy: Order the nodes by h only and stop at the first goal.
+    - stats: Optional SearchStats, filled with the totals of all the workers.
+    - workers: Number of worker processes (default: number of cores).
+    - time_limit, node_limit, memory_limit: Limits of the search (see search.limit_reached),
+      the memory limit applies to each worker.
+    - explored: Not supported, the states are kept in the workers. Passed on to the sequential search.
+
+    Returns:
+    - Node: The goal node, None if there is no solution, 'timeout' if a limit was reached.
+
+    Raises:
+    - RuntimeError: A worker process failed (with its traceback) or exited.
+    """
+    workers = workers or os.cpu_count() or 1
+    if 'fork' not in multiprocessing.get_all_start_methods() or multiprocessing.current_process().daemon:
+        if greedy:
+            return search.best_first_graph_search(problem, h, stats, time_limit=time_limit, node_limit=node_limit,
+                                                  memory_limit=memory_limit, explored=explored)
+        return search.astar_graph_search(problem, h, stats, time_limit=time_limit, node_limit=node_limit,
+                                         memory_limit=memory_limit, explored=explored)
+
+    stats = stats or search.SearchStats()
+    stats.start()
+    context = multiprocessing.get_context('fork')
+    shared = {
+        'lock': context.Lock(),
+        # Messages sent and received, a worker is idle when it has nothing to expand.
+        'sent': context.Value('q', 0, lock=False),
+        'received': context.Value('q', 0, lock=False),
+        'idle': context.Array('b', workers, lock=False),
+        # Cost of the best goal found, the workers drop the nodes that can not beat it.
+        'incumbent': context.Value('d', float('inf'), lock=False),
+        # Set when the workers must stop expanding (they still answer the trace requests).
+        'halt': context.Value('b', 0, lock=False),
+        'expanded': context.Array('q', workers, lock=False),
+        'generated': context.Array('q', workers, lock=False),
+        'frontier_max': context.Array('q', workers, lock=False),
+    }
+    inboxes = [context.Queue() for _ in range(workers)]
+    results = context.Queue()
+    processes = [context.Process(target=search_worker, args=(index, problem, h, greedy, inboxes, results, shared, memory_limit),
+                                 daemon=True) for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    send(shared, inboxes, hash(problem.initial) % workers, [(problem.initial, 0, None, None)])
+
+    goal, goal_cost, reason, error = None, float('inf'), None, None
+    while True:
+        try:
+            message = results.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            message = None
+        error = worker_error(message, results, processes)
+        if error:
+            break
+        if message is not None and message[0] == 'goal':
+            with shared['lock']:
+                shared['received'].value += 1
+            if message[2] < goal_cost:
+                goal, goal_cost = message[1], message[2]
+                if greedy:
+                    break
+        elif message is not None and message[0] == 'limit':
+            reason = message[1]
+            break
+
+        stats.expanded = sum(shared['expanded'])
+        reason = search.limit_reached(stats, time_limit, node_limit)
+        if reason:
+            break
+        # Quiescence: every worker is idle and every message sent was received (goals included).
+        with shared['lock']:
+            if all(shared['idle']) and shared['sent'].value == shared['received'].value:
+                break
+
+    shared['halt'].value = 1
+    node = None
+    try:
+        if goal is not None and reason is None and error is None:
+            node = solution_node(problem, goal, workers, inboxes, results, processes)
+    finally:
+        for inbox in inboxes:
+            inbox.put(('stop',))
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.kill()
+        for channel in inboxes + [results]:
+            channel.cancel_join_thread()
+
+    if error:
+        stats.stop()
+        raise RuntimeError(error)
+    stats.expanded = sum(shared['expanded'])
+    stats.generated = sum(shared['generated'])
+    stats.frontier_max = sum(shared['frontier_max'])
+    stats.stop(reason)
+    if reason:
+        return 'timeout'
+    if node is not None:
+        for hook in search.event_hooks(problem, 'solution')[0]:
+            hook('solution', node, stats)
+    return node
+
+
+def send(shared, inboxes, owner, nodes):
+    """
+    Send a batch of (state, g, parent state, action) nodes to the worker that owns them.
+    The message is counted as sent before it is queued, so it is never missed by the quiescence check.
+    """
+    with shared['lock']:
+        shared['sent'].value += 1
+    inboxes[owner].put(('nodes', nodes))
+
+
+def worker_error(message, results, processes):
+    """
+    Description of the failure of a worker: the traceback it sent, or the exit code of a worker
+    that exited without one. None if every worker is running.
+    """
+    if message is not None and message[0] == 'error':
+        return 'search worker {} failed:\n{}'.format(message[1], message[2])
+    for index, process in enumerate(processes):
+        if process.exitcode is not None:
+            # A failed worker queues its traceback before it exits, the other messages are dropped.
+            try:
+                while True:
+                    message = results.get(timeout=POLL_INTERVAL)
+                    if message[0] == 'error':
+                        return worker_error(message, results, [])
+            except queue.Empty:
+                return 'search worker {} exited with code {}'.format(index, process.exitcode)
+    return None
+
+
+def solution_node(problem, goal, workers, inboxes, results, processes):
+    """
+    Rebuild the path to the goal state: the owner of each state gives its parent and the action
+    from the parent, then the actions are replayed from the initial state.
+    Raises a RuntimeError if a worker fails meanwhile.
+    """
+    actions = []
+    state = goal
+    while True:
+        inboxes[hash(state) % workers].put(('trace', state))
+        while True:
+            try:
+                message = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                message = None
+            error = worker_error(message, results, processes)
+            if error:
+                raise RuntimeError(error)
+            if message is not None and message[0] == 'trace' and message[1] == state:
+                break
+        _, _, parent, action = message
+        if parent is None:
+            break
+        actions.append(action)
+        state = parent
+    actions.reverse()
+
+    node = search.Node(problem.initial)
+    for action in actions:
+        node = node.child_node(problem, action)
+    return node
+
+
+def search_worker(index, problem, h, greedy, inboxes, results, shared, memory_limit=None):
+    """
+    Entry point of a worker process: run worker_loop, and send the traceback of an exception
+    to the calling process (the messages of the worker are lost, the search can not go on).
+    """
+    try:
+        worker_loop(index, problem, h, greedy, inboxes, results, shared, memory_limit)
+    except BaseException:
+        results.put(('error', index, traceback.format_exc()))
+
+
+def worker_loop(index, problem, h, greedy, inboxes, results, shared, memory_limit=None):
+    """
+    Main loop of a worker process: receive nodes, expand the best open node in rounds of
+    EXPANSION_ROUND expansions, send the children to their owners. Runs until a 'stop' message.
+    """
+    workers = len(inboxes)
+    inbox = inboxes[index]
+    lock, idle, incumbent, halt = shared['lock'], shared['idle'], shared['incumbent'], shared['halt']
+    batch = getattr(h, 'batch', None)
+
+    best = {}  # state -> (g, parent state, action) of the states owned by this worker
+    closed = set()
+    open_list = []  # heap of [f, counter, g, state]
+    counter = itertools.count()
+    expanded = generated = frontier_max = 0
+
+    def add_nodes(nodes):
+        # Keep the nodes that improve the path cost of their state, and queue them.
+        new_nodes = []
+        for state, g, parent, action in nodes:
+            known = best.get(state)
+            if known is not None and known[0] <= g:
+                continue
+            best[state] = (g, parent, action)
+            closed.discard(state)
+            new_nodes.append(search.Node(state, None, action, g))
+        values = batch(new_nodes) if batch is not None else [h(node) for node in new_nodes]
+        for node, value in zip(new_nodes, values):
+            f = value if greedy else node.path_cost + value
+            heapq.heappush(open_list, (f, next(counter), node.path_cost, node.state))
+
+    while True:
+        # Read the waiting messages, wait for one if there is nothing to expand.
+        wait = halt.value or not open_list
+        while True:
+            try:
+                message = inbox.get(True, POLL_INTERVAL) if wait else inbox.get_nowait()
+            except queue.Empty:
+                if wait and not halt.value:
+                    with lock:
+                        idle[index] = 1
+                break
+            if message[0] == 'stop':
+                return
+            if message[0] == 'trace':
+                _, parent, action = best[message[1]]
+                results.put(('trace', message[1], parent, action))
+            elif not halt.value:
+                with lock:
+                    idle[index] = 0
+                    shared['received'].value += 1
+                add_nodes(message[1])
+            wait = False
+        if halt.value or not open_list:
+            continue
+
+        # Expand a round of nodes, the children owned by this worker are queued directly.
+        outboxes = [[] for _ in range(workers)]
+        for _ in range(EXPANSION_ROUND):
+            if not open_list:
+                break
+            f, _, g, state = heapq.heappop(open_list)
+            if state in closed or best[state][0] != g:
+                continue
+            if not greedy and f >= incumbent.value:
+                # Can not lead to a better goal than the one found (all the nodes left are as bad).
+                open_list.clear()
+                break
+            if problem.goal_test(state):
+                # The goal message is counted as sent, the search is not quiescent until it is read.
+                with lock:
+                    if g < incumbent.value:
+                        incumbent.value = g
+                    shared['sent'].value += 1
+                results.put(('goal', state, g))
+                continue
+
+            closed.add(state)
+            expanded += 1
+            for action in problem.actions(state):
+                child = problem.result(state, action)
+                generated += 1
+                outboxes[hash(child) % workers].append((child, problem.path_cost(g, state, action, child), state, action))
+
+            if memory_limit is not None and expanded % search.MEMORY_CHECK_INTERVAL == 0:
+                usage = search.memory_usage()
+                if usage is not None and usage >= memory_limit:
+                    results.put(('limit', 'memory'))
+
+        for owner, nodes in enumerate(outboxes):
+            if not nodes:
+                continue
+            if owner == index:
+                add_nodes(nodes)
+            else:
+                send(shared, inboxes, owner, nodes)
+
+        shared['expanded'][index] = expanded
+        shared['generated'][index] = generated
+        frontier_max = max(frontier_max, len(open_list))
+        shared['frontier_max'][index] = frontier_max
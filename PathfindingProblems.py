@@ -13,6 +13,8 @@ class PathfindingProblems:
             """
             super().__init__(initial, goal)
             self.warehouse = warehouse
+            # The boxes do not move during the search, a set makes is_walkable O(1).
+            self.boxes = frozenset(warehouse.boxes)
 
         def actions(self, state):
             """ 
@@ -82,7 +84,7 @@ class PathfindingProblems:
             Returns:
             - bool: True if the position is walkable, otherwise False.
             """
-            return pos not in self.warehouse.walls and pos not in self.warehouse.boxes
+            return pos not in self.warehouse.walls and pos not in self.boxes
 
 
     class WarehouseLookupTableProblem(search.Problem):
@@ -138,11 +140,9 @@ class PathfindingProblems:
 
             self.initial = (initial, goal)  # Combining the box's initial position and goal into a state.
             self.goal = goal
-            self.walls = walls 
-            self.boxes = ()
-            for box in boxes:
-                if box != initial:  # Avoid adding the moving box to the boxes set.
-                    self.boxes += (box,)
+            self.walls = frozenset(walls)
+            # Avoid adding the moving box to the boxes set.
+            self.boxes = frozenset(box for box in boxes if box != initial)
 
         def actions(self, state):
             """Return possible movement directions for the box."""
@@ -0,0 +1,206 @@
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from multiprocessing.connection import wait
+
+from sokoban import Warehouse
+from BatchSolver import BatchSolver
+from Benchmark import Benchmark
+from SequenceValidator import SequenceValidator
+
+
+class PortfolioSolver:
+    '''
+    Race several solver configurations on the same warehouse.
+
+    Every configuration (engine, heuristic, state mode) solves the warehouse in its own
+    worker process. The first solution that replays correctly on the warehouse wins and the
+    other workers are killed, so the time spent on a level is the time of the configuration
+    that is best on that level. The winning configuration is recorded with the result.
+
+    Configurations are named 'engine/heuristic/mode' as in Benchmark, mode being one of Benchmark.MODES.
+
+    Example:
+        python PortfolioSolver.py warehouses/ --timeout 60 --output portfolio.jsonl
+    '''
+
+    DEFAULT_CONFIGS = [
+        'best_first/heuristic83Lookup/push',
+        'bidirectional/heuristic83Lookup/push',
+        'best_first/heur_manhattan_distance/push',
+        'astar/heuristic83Lookup/elementary',
+    ]
+
+    @staticmethod
+    def config_options(config, options):
+        '''
+        Solver options of a configuration, on top of the options shared by all the configurations.
+        '''
+        parts = config.split('/')
+        if len(parts) != 3 or parts[2] not in Benchmark.MODES:
+            raise ValueError('invalid configuration {}, expected engine/heuristic/mode'.format(config))
+        engine, heuristic, mode = parts
+        config_options = dict(options, engine=engine, heuristic=heuristic)
+        config_options.update(Benchmark.MODES[mode])
+        return config_options
+
+    @staticmethod
+    def verify(warehouse_file, moves):
+        '''
+        Replay a list of macro moves ((row, column), direction) on a warehouse.
+
+        Returns:
+        - bool: True if every push is possible (the worker can walk behind the box and the
+                cell in front of it is free) and all the boxes end on the targets.
+        '''
+        warehouse = Warehouse()
+        warehouse.load_warehouse(warehouse_file)
+        verdict = SequenceValidator(warehouse).validate(moves, macro=True)
+        return verdict['valid'] and verdict['solved']
+
+    @staticmethod
+    def solve(warehouse_file, configs, options, timeout=None):
+        '''
+        Race the configurations on one warehouse.
+
+        Parameters:
+        - warehouse_file: Warehouse file path.
+        - configs: List of configuration names.
+        - options: Solver options shared by all the configurations (see BatchSolver.run).
+        - timeout: Search time limit in seconds of every configuration.
+
+        Returns:
+        - dict: The result record of the winning configuration, with 'config' (its name)
+                and 'configs' (the outcome of every configuration). Without a winner, the record
+                only has the warehouse, the status and the outcomes.
+        '''
+        start = time.time()
+        running = {}  # connection -> (process, configuration)
+        for config in configs:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            config_options = dict(PortfolioSolver.config_options(config, options), time_limit=timeout)
+            process = multiprocessing.Process(target=BatchSolver.solve_one, args=(warehouse_file, config_options, sender), daemon=True)
+            process.start()
+            sender.close()
+            running[receiver] = (process, config)
+
+        # The searches stop themselves at the time limit, the workers are only killed if they do not.
+        kill_timeout = timeout + BatchSolver.KILL_GRACE if timeout is not None else None
+        outcomes = {}
+        winner = None
+        while running and winner is None:
+            wait_time = max(0, start + kill_timeout - time.time()) if kill_timeout is not None else None
+            ready = wait(list(running) + [process.sentinel for process, _ in running.values()], wait_time)
+            if not ready:
+                break
+
+            for receiver in list(running):
+                process, config = running[receiver]
+                if receiver not in ready and process.sentinel not in ready:
+                    continue
+                record = None
+                try:
+                    if receiver.poll():
+                        record = receiver.recv()
+                except (EOFError, OSError):
+                    pass
+                if record is None and process.is_alive():
+                    continue
+
+                process.join()
+                receiver.close()
+                del running[receiver]
+                outcomes[config] = record['status'] if record is not None else 'error'
+                if outcomes[config] == 'solved':
+                    if PortfolioSolver.verify(warehouse_file, ast.literal_eval(record['answer'])):
+                        if winner is None:
+                            winner = record
+                            winner['config'] = config
+                    else:
+                        outcomes[config] = 'invalid'
+
+        # Cancel the configurations still running.
+        for receiver, (process, config) in running.items():
+            process.kill()
+            process.join()
+            receiver.close()
+            outcomes[config] = 'cancelled' if winner is not None else 'timeout'
+
+        if winner is not None:
+            record = winner
+        else:
+            statuses = set(outcomes.values())
+            status = 'impossible' if 'impossible' in statuses else 'timeout' if 'timeout' in statuses else 'error'
+            record = {'warehouse': os.path.basename(warehouse_file), 'status': status, 'config': None}
+        record['configs'] = outcomes
+        record['elapsed_time'] = round(time.time() - start, 3)
+        return record
+
+    @staticmethod
+    def run(warehouse_files, configs, options, write_record, timeout=None):
+        '''
+        Race the configurations on every warehouse, one warehouse at a time.
+
+        Returns:
+        - Counter: Number of wins of each configuration.
+        '''
+        wins = Counter()
+        for warehouse_file in warehouse_files:
+            record = PortfolioSolver.solve(warehouse_file, configs, options, timeout)
+            if record['config'] is not None:
+                wins[record['config']] += 1
+            write_record(record)
+        return wins
+
+    @staticmethod
+    def main(argv=None):
+        '''
+        Command line entry point.
+        '''
+        parser = argparse.ArgumentParser(description='Race several solver configurations on each Sokoban warehouse.')
+        parser.add_argument('paths', nargs='+', help='warehouse files, directories or glob patterns')
+        parser.add_argument('--configs', nargs='+', default=PortfolioSolver.DEFAULT_CONFIGS,
+                            help='configurations engine/heuristic/mode (mode: {})'.format(', '.join(sorted(Benchmark.MODES))))
+        parser.add_argument('--timeout', type=float, default=None, help='time limit per warehouse in seconds')
+        parser.add_argument('--memory-limit', type=int, default=None, help='memory cap per worker in MB')
+        parser.add_argument('--board-cache', default=None, help='directory of the precomputed board cache (default: no cache)')
+        parser.add_argument('--output', default=None, help='output JSONL file (default: stdout)')
+        args = parser.parse_args(argv)
+
+        warehouse_files = BatchSolver.find_warehouses(args.paths)
+        if not warehouse_files:
+            parser.error('no warehouse file found')
+        for config in args.configs:
+            try:
+                PortfolioSolver.config_options(config, {})
+            except ValueError as e:
+                parser.error(str(e))
+
+        options = {
+            'allow_taboo_push': False,
+            'memory_limit': args.memory_limit,
+            'board_cache': args.board_cache,
+        }
+
+        out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            def write_record(record):
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+
+            wins = PortfolioSolver.run(warehouse_files, args.configs, options, write_record, args.timeout)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        for config in args.configs:
+            print('{:<45} won {:>4}'.format(config, wins[config]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    PortfolioSolver.main()
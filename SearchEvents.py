@@ -0,0 +1,199 @@
+import json
+import sys
+import time
+from queue import Full
+
+try:
+    from IPython.display import clear_output
+except ImportError:
+    clear_output = None
+
+from Utility import Utility
+
+
+class SearchEvents:
+    '''
+    Hooks of a search run.
+
+    The search engines and the SokobanPuzzle emit the events below to the callbacks subscribed
+    to them. A callback is called with the name of the event and its payload:
+    - 'expanded' (node): a node is expanded.
+    - 'generated' (node): a child node is generated.
+    - 'pruned' (node, reason): a generated node is dropped by the search ('explored': its state
+      is already explored, 'duplicate': the frontier has it with a better value, 'bound': its f
+      is over the bound of an IDA* iteration).
+    - 'deadlock' (boxes, box, new_box, kind): the puzzle rejects a push of the box from cell id
+      box to cell id new_box ('freeze' or 'pair' deadlock).
+    - 'solution' (node, stats): the goal node and the SearchStats of the search.
+
+    The events go through the 'events' attribute of the problem (None by default). The engines
+    hold the list of callbacks of each event (search.event_hooks) and only call them when it is
+    not empty, so an event with no subscriber costs one test. The bidirectional engine only
+    emits 'solution' (it does not build nodes). The parallel engines emit 'solution' in the calling
+    process, the 'deadlock' events of the puzzle being emitted in the worker processes.
+
+    Example:
+        events = SearchEvents()
+        events.subscribe(RateLimited(TerminalSink(), 0.5), 'expanded')
+        events.subscribe(FileSink('run.jsonl'), 'solution', 'deadlock')
+        Solver.solve_sokoban_macro(warehouse, events=events)
+    '''
+
+    EVENTS = ('expanded', 'generated', 'pruned', 'deadlock', 'solution')
+
+    def __init__(self):
+        # One list per event, the engines keep references to these lists (subscribe updates them in place).
+        self.subscribers = {event: [] for event in self.EVENTS}
+
+    def subscribe(self, callback, *events):
+        '''
+        Call callback(event, *payload) on the given events (all the events if none is given).
+        '''
+        for event in events or self.EVENTS:
+            self.subscribers[event].append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        for callbacks in self.subscribers.values():
+            while callback in callbacks:
+                callbacks.remove(callback)
+
+    def hooks(self, event):
+        '''
+        The (live) list of callbacks of an event.
+        '''
+        return self.subscribers[event]
+
+    def emit(self, event, *payload):
+        for callback in self.subscribers[event]:
+            callback(event, *payload)
+
+    @staticmethod
+    def describe(event, payload):
+        '''
+        JSON-serializable record of an event.
+        '''
+        if event == 'deadlock':
+            boxes, box, new_box, kind = payload
+            return {'event': event, 'box': box, 'new_box': new_box, 'kind': kind}
+
+        record = {'event': event}
+        for value in payload:
+            if hasattr(value, 'as_dict'):
+                record.update(value.as_dict())
+            elif hasattr(value, 'state'):
+                record.update({'state': repr(value.state), 'action': repr(value.action),
+                               'path_cost': value.path_cost, 'depth': value.depth})
+            else:
+                record['reason'] = value
+        return record
+
+
+class Sampled:
+    '''
+    Callback wrapper passing on one event every 'every' events.
+    '''
+
+    def __init__(self, callback, every=1000):
+        self.callback = callback
+        self.every = every
+        self.count = 0
+
+    def __call__(self, event, *payload):
+        self.count += 1
+        if self.count % self.every == 0:
+            self.callback(event, *payload)
+
+
+class RateLimited:
+    '''
+    Callback wrapper passing on at most one event every 'interval' seconds (the others are dropped).
+    '''
+
+    def __init__(self, callback, interval=0.1):
+        self.callback = callback
+        self.interval = interval
+        self.next_time = 0.0
+
+    def __call__(self, event, *payload):
+        now = time.perf_counter()
+        if now >= self.next_time:
+            self.next_time = now + self.interval
+            self.callback(event, *payload)
+
+
+class FileSink:
+    '''
+    Writes the events as JSON lines (see SearchEvents.describe), with the time since the sink was created.
+    '''
+
+    def __init__(self, file):
+        '''
+        Parameters:
+        - file: A file path (opened for writing) or an open text file.
+        '''
+        self.own_file = isinstance(file, str)
+        self.file = open(file, 'w') if self.own_file else file
+        self.start_time = time.perf_counter()
+
+    def __call__(self, event, *payload):
+        record = SearchEvents.describe(event, payload)
+        record['time'] = round(time.perf_counter() - self.start_time, 6)
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class TerminalSink:
+    '''
+    Prints one line per event.
+    '''
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+
+    def __call__(self, event, *payload):
+        record = SearchEvents.describe(event, payload)
+        del record['event']
+        print('{:<10} {}'.format(event, ' '.join('{}={}'.format(key, value) for key, value in record.items())),
+              file=self.stream, flush=True)
+
+
+class QueueSink:
+    '''
+    Puts (event, record) pairs on a queue (queue.Queue or multiprocessing.Queue) without blocking,
+    the events arriving while the queue is full are counted in 'dropped'.
+    '''
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.dropped = 0
+
+    def __call__(self, event, *payload):
+        try:
+            self.queue.put_nowait((event, SearchEvents.describe(event, payload)))
+        except Full:
+            self.dropped += 1
+
+
+class NotebookViewer:
+    '''
+    Shows the warehouse of the expanded nodes in a notebook (the observer mode of the Solver).
+    Use it with RateLimited so that drawing does not slow down the search.
+    '''
+
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+
+    def __call__(self, event, node, *payload):
+        puzzle = self.puzzle
+        worker, boxes = puzzle.decode_state(node.state)
+        wh = Utility.build_wh(puzzle.walls, puzzle.targets, boxes, worker)
+        if clear_output is not None:
+            clear_output(wait=True)
+        print("heuristic:", puzzle.prev_heur, ", cost:", node.path_cost, ", stucked:", puzzle.stucked_case_count)
+        print(wh)
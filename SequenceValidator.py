@@ -0,0 +1,185 @@
+from array import array
+
+from StaticBoard import StaticBoard
+from Zobrist import ZobristKeys
+from sokoban import FrozenWarehouse
+
+
+class SequenceValidator:
+    '''
+    Replays action sequences on a warehouse without modifying it.
+
+    The layout is numbered once (cell ids in sorted (x,y) order, as in StaticBoard) and the boxes
+    of a replay are a bytearray indexed by cell id, so every step is a few array lookups.
+    Elementary sequences are lists of 'Left', 'Right', 'Up', 'Down'; macro sequences are lists of
+    ((row, column), direction) pushes, the worker walking to the box without pushing anything.
+
+    Each sequence gets a verdict (a dictionary):
+    - 'valid': True if every action is legal.
+    - 'failed_at': Index of the first illegal action, None if there is none.
+    - 'solved': True if the boxes are all on targets after the legal actions.
+    - 'state_hash': Zobrist key of the state after the legal actions (the same state of the same
+                    layout always gets the same key, see ZobristKeys).
+    - 'warehouse': With render=True only, the str() of the warehouse in that state.
+
+    Example:
+        validator = SequenceValidator(warehouse)
+        verdicts = validator.validate_many(solutions, macro=True)
+    '''
+
+    ACTION_INDEX = {action: index for index, action in enumerate(StaticBoard.ACTIONS)}
+
+    def __init__(self, warehouse, board=None):
+        '''
+        Parameters:
+        - warehouse: A valid Warehouse or FrozenWarehouse object (only read).
+        - board: Optional StaticBoard of the warehouse, whose cell tables are reused.
+        '''
+        # The frozen layout answers is_wall in O(1) and the rendered states share it.
+        if not isinstance(warehouse, FrozenWarehouse):
+            warehouse = warehouse.freeze()
+        self.warehouse = warehouse
+        if board is not None:
+            self.cells, self.cell_ids, self.neighbours = board.cells, board.cell_ids, board.neighbours
+            self.opposite_actions = board.opposite_actions
+        else:
+            self.create_cell_tables(warehouse)
+
+        n_cells = len(self.cells)
+        self.worker = self.cell_ids[warehouse.worker]
+        self.occupied = bytearray(n_cells)
+        for box in warehouse.boxes:
+            self.occupied[self.cell_ids[box]] = 1
+        self.is_target = bytearray(n_cells)
+        for target in warehouse.targets:
+            self.is_target[self.cell_ids[target]] = 1
+        self.keys = ZobristKeys(n_cells)
+
+        # Flood fill marks of the macro replays: a cell is reached when its mark is the current stamp.
+        self.marks = array('i', [0]) * n_cells
+        self.stamp = 0
+
+    def create_cell_tables(self, warehouse):
+        '''
+        Number the cells the worker can walk to (ignoring the boxes) and build their neighbour table,
+        without the rest of the StaticBoard precomputation.
+        '''
+        moves = [StaticBoard.MOVES[action] for action in StaticBoard.ACTIONS]
+
+        inside = {warehouse.worker}
+        stack = [warehouse.worker]
+        while stack:
+            x, y = stack.pop()
+            for dx, dy in moves:
+                cell = (x + dx, y + dy)
+                if cell not in inside and not warehouse.is_wall(cell):
+                    inside.add(cell)
+                    stack.append(cell)
+
+        self.cells = sorted(inside)
+        self.cell_ids = {cell: cell_id for cell_id, cell in enumerate(self.cells)}
+        self.neighbours = [tuple(self.cell_ids.get((x + dx, y + dy), -1) for dx, dy in moves) for x, y in self.cells]
+        self.opposite_actions = [StaticBoard.ACTIONS.index(action) for action in ['Right', 'Left', 'Down', 'Up']]
+
+    def replay(self, action_seq):
+        '''
+        Replay elementary actions.
+
+        Returns:
+        - tuple: (index of the first illegal action or None, worker cell id, box bytearray).
+        '''
+        neighbours = self.neighbours
+        action_index = self.ACTION_INDEX
+        occupied = bytearray(self.occupied)
+        worker = self.worker
+        for index, action in enumerate(action_seq):
+            direction = action_index.get(action)
+            if direction is None:
+                return index, worker, occupied
+            cell = neighbours[worker][direction]
+            if cell < 0:
+                return index, worker, occupied
+            if occupied[cell]:
+                front = neighbours[cell][direction]
+                if front < 0 or occupied[front]:
+                    return index, worker, occupied
+                occupied[cell] = 0
+                occupied[front] = 1
+            worker = cell
+        return None, worker, occupied
+
+    def replay_macro(self, macro_seq):
+        '''
+        Replay macro actions ((row, column), direction).
+
+        Returns:
+        - tuple: (index of the first illegal action or None, worker cell id, box bytearray).
+        '''
+        neighbours = self.neighbours
+        cell_ids = self.cell_ids
+        action_index = self.ACTION_INDEX
+        occupied = bytearray(self.occupied)
+        worker = self.worker
+        for index, ((row, column), action) in enumerate(macro_seq):
+            box = cell_ids.get((column, row), -1)
+            direction = action_index.get(action)
+            if box < 0 or direction is None or not occupied[box]:
+                return index, worker, occupied
+            front = neighbours[box][direction]
+            behind = neighbours[box][self.opposite_actions[direction]]
+            if front < 0 or occupied[front] or behind < 0 or not self.can_reach(worker, behind, occupied):
+                return index, worker, occupied
+            occupied[box] = 0
+            occupied[front] = 1
+            worker = box
+        return None, worker, occupied
+
+    def can_reach(self, start, goal, occupied):
+        '''
+        True if the worker can walk from start to goal without pushing a box.
+        '''
+        if start == goal:
+            return True
+        if occupied[goal]:
+            return False
+        neighbours = self.neighbours
+        marks = self.marks
+        self.stamp += 1
+        stamp = self.stamp
+        marks[start] = stamp
+        stack = [start]
+        while stack:
+            for cell in neighbours[stack.pop()]:
+                if cell >= 0 and marks[cell] != stamp and not occupied[cell]:
+                    if cell == goal:
+                        return True
+                    marks[cell] = stamp
+                    stack.append(cell)
+        return False
+
+    def validate(self, action_seq, macro=False, render=False):
+        '''
+        Replay one sequence and give its verdict (see the class description).
+
+        Parameters:
+        - action_seq: Elementary actions, or macro actions with macro=True.
+        - macro: The sequence is made of ((row, column), direction) pushes.
+        - render: Add the str() of the warehouse in the final state to the verdict.
+        '''
+        failed_at, worker, occupied = self.replay_macro(action_seq) if macro else self.replay(action_seq)
+        boxes = [cell for cell, box in enumerate(occupied) if box]
+        verdict = {
+            'valid': failed_at is None,
+            'failed_at': failed_at,
+            'solved': all(self.is_target[box] for box in boxes),
+            'state_hash': self.keys.state_key(worker, boxes),
+        }
+        if render:
+            verdict['warehouse'] = str(self.warehouse.copy(worker=self.cells[worker], boxes=[self.cells[box] for box in boxes]))
+        return verdict
+
+    def validate_many(self, sequences, macro=False, render=False):
+        '''
+        Verdicts of a list of sequences of the same warehouse, in the same order.
+        '''
+        return [self.validate(action_seq, macro, render) for action_seq in sequences]
@@ -1,40 +1,63 @@
 import search
-import time
+from bisect import insort
 from Utility import *
-from IPython.display import clear_output
+from StaticBoard import StaticBoard
+from ActionStateValidation import ActionStateValidation
+from Zobrist import ZobristKeys, ZobristState
+from DeadlockTable import DeadlockTable
+from MacroMoves import MacroMoves
+from SearchEvents import SearchEvents, RateLimited, NotebookViewer
+from SequenceValidator import SequenceValidator
  
 class SokobanPuzzle(search.Problem): 
     
     # Constructor for the SokobanPuzzle class.
-    def __init__(self, warehouse, allow_taboo_push=False, macro=False, show_wh=False, show_taboo_cells=False, observer_mode=False):     
+    def __init__(self, warehouse, allow_taboo_push=False, macro=False, show_wh=False, show_taboo_cells=False, observer_mode=False, compact_states=False, heuristic_cache_size=100000, board_cache=None, zobrist=False, freeze_deadlocks=True, pair_deadlocks=None, push_macros=False, events=None):     
         # Defining the goal state.
         self.goal = tuple(warehouse.targets)
         # Defining the initial state.
         self.initial = (warehouse.worker, tuple(warehouse.boxes))
+        # Precomputing the static board (walls, targets, dead squares, distances),
+        # or reusing the one of the same layout from the board cache (a BoardCache).
+        self.board = board_cache.board(warehouse) if board_cache is not None else StaticBoard(warehouse)
         # Storing the wall locations.
-        self.walls = warehouse.walls
+        self.walls = self.board.walls
         
         # Other class attributes and configurations.
         self.allow_taboo_push = allow_taboo_push
         self.macro = macro
-        self.targets = warehouse.targets
+        self.targets = self.board.targets
         self.worker = warehouse.worker
         self.boxes = warehouse.boxes
-        self.taboo_map, self.x_size, self.y_size, self.inside_cells = Utility.taboo_cells(warehouse, get_additional_values=True)
+        self.taboo_map, self.x_size, self.y_size, self.inside_cells = self.board.taboo_map, self.board.x_size, self.board.y_size, self.board.inside_cells
     
-        self.taboo_cells = Utility.find_taboo_cells(self.taboo_map)
+        # Dead squares (a set) of the static board, a box pushed there can never reach a target.
+        self.taboo_cells = self.board.dead_squares
         self.cost = 0
         
          
         self.prev_heur = None
-        self.possible_actions = ['Left', 'Right', 'Up', 'Down']
+        self.possible_actions = StaticBoard.ACTIONS
         self.wh = Utility.build_wh(self.walls, self.targets, self.boxes, self.worker)
-        self.heuristic_count = 0
-        self.stop = False
+        # Bounded LRU caches of the values of the pure heuristics, one per heuristic.
+        self.heuristic_caches = {}
+        self.heuristic_cache_size = heuristic_cache_size
         self.stucked_case_count = 0
-        self.box_can_not_go_target_count = 0
+        # Pushes that freeze a box off target are pruned when the successors are generated
+        # (counted in stucked_case_count).
+        self.freeze_deadlocks = freeze_deadlocks
+        # Two-box deadlock table of the layout (a DeadlockTable), built before the search with
+        # pair_deadlocks='wait' or in a background thread with pair_deadlocks='background'.
+        self.deadlock_table = None
+        if pair_deadlocks is not None:
+            self.deadlock_table = self.create_deadlock_table(warehouse, board_cache, pair_deadlocks == 'background')
          
-        self.observer_mode = observer_mode
+        # Hooks of the search (a SearchEvents), the observer mode shows the expanded states in the notebook.
+        if observer_mode:
+            events = events or SearchEvents()
+            events.subscribe(RateLimited(NotebookViewer(self), 0.1), 'expanded')
+        self.events = events
+        self.deadlock_hooks, = search.event_hooks(self, 'deadlock')
         # Displaying the initial state if 'show_wh' is true.
         if show_wh :
             print("-------initial---------")
@@ -49,16 +72,53 @@ class SokobanPuzzle(search.Problem):
             print("---------------------------")
     
       
-        # Creating a lookup table.
-        self.lookup_table = self.create_lookup_table(warehouse) 
+        # Cell ids and all-pairs distances of the static board.
+        # The (position pair -> cost) lookup table is only built when it is used.
+        self.cells = self.board.cells
+        self.cell_ids, self.distance_matrix = self.board.cell_ids, self.board.distance_matrix
+        self._lookup_table = None
+
+        # Switching to the compact integer encoding of the states if requested.
+        # The push-level (macro) search also works on the cell id tables.
+        self.compact_states = compact_states
+        if compact_states or macro or zobrist:
+            self.create_compact_encoding()
+        if compact_states:
+            self.initial = self.encode_state(self.initial)
+
+        # In push-level (macro) search the worker is replaced by a canonical position of its reachable region.
+        if macro:
+            self.initial = self.normalize_state(self.initial)
+
+        # Tunnel and goal-room macro pushes (push-level search only).
+        self.macro_moves = MacroMoves(self.board) if macro and push_macros else None
+
+        # With Zobrist hashing the states carry a 64-bit key that result() updates in O(1).
+        self.zobrist = zobrist
+        if zobrist:
+            self.zobrist_keys = ZobristKeys(len(self.cells))
+            self.zobrist_cell_id = (lambda cell: cell) if compact_states else self.cell_ids.__getitem__
+            worker, boxes = self.state_to_ids(self.initial)
+            self.initial = ZobristState(*self.initial, self.zobrist_keys.state_key(worker, boxes))
         
+    @property
+    def lookup_table(self):
+        """
+        Dictionary of the moving costs between cells (see create_lookup_table), built on first use.
+        """
+        if self._lookup_table is None:
+            self._lookup_table = self.create_lookup_table()
+        return self._lookup_table
       
-    def create_lookup_table(self, warehouse):
+    def create_lookup_table(self, warehouse=None):
         """
         Creates a lookup table to store moving costs between various cells inside the warehouse.
 
+        The costs are taken from the dense distance matrix of the static board, which is filled
+        with one BFS per inside cell instead of running a separate A* search for every pair of cells.
+
         Parameters:
-        - warehouse (list[list[int]]): A 2D list representing the warehouse where each cell's value indicates its type.
+        - warehouse: Unused, kept for compatibility (the costs come from the static board).
 
         Returns:
         - dict: A dictionary where keys are tuples of start and target positions, and values are the corresponding moving costs.
@@ -66,31 +126,332 @@ class SokobanPuzzle(search.Problem):
         # Initialize a dictionary to store the moving costs between cells.
         lookup_table = {} 
 
-        # Extract all valid start positions from inside_cells and swap their coordinates.
-        swapped_start_positions = [Utility.swap_coordinates(pos) for pos in self.inside_cells]
+        # The inside cells are numbered in sorted (x,y) order by the static board,
+        # so (cells[i], cells[j]) is an already sorted key whenever i < j.
+        n_cells = len(self.cells)
+
+        for start_id in range(n_cells):
+            row = start_id * n_cells
+            # Only visit the upper triangle, the costs of two symmetric positions are the same.
+            for target_id in range(start_id + 1, n_cells):
+                cost = self.distance_matrix[row + target_id]
+
+                # If there's a valid cost, update the lookup table.
+                if cost >= 0:
+                    lookup_table[(self.cells[start_id], self.cells[target_id])] = cost
+
+        return lookup_table 
+
+    def create_deadlock_table(self, warehouse, board_cache=None, background=False):
+        """
+        Two-box deadlock table of the layout, from the board cache if there is one.
+
+        Parameters:
+        - background: Build the table in a background thread, the search does not wait for it.
+
+        Returns:
+        - DeadlockTable: The table (not ready yet when built in the background).
+        """
+        if board_cache is not None:
+            return board_cache.deadlock_table(warehouse, background)
+        table = DeadlockTable(self.board)
+        if background:
+            table.start()
+        else:
+            table.compute()
+        return table
+
+    def create_compact_encoding(self):
+        """
+        Prepares the tables used by the compact integer encoding of the states.
+
+        In the compact encoding a state is (worker_id, sorted_tuple_of_box_ids) where the ids
+        are the cell ids numbered by the static board. 
+        """
+        # Neighbour tables of the static board.
+        self.neighbours = self.board.neighbours
+        self.opposite_actions = self.board.opposite_actions
+
+        # Dead squares and goal configuration as cell ids.
+        self.taboo_ids = self.board.dead_ids
+        self.goal_ids = self.board.target_ids
+
+    def encode_state(self, state):
+        """
+        Converts a (worker_xy, tuple_of_box_xy) state into the compact (worker_id, sorted_box_ids) state.
+        """
+        worker, boxes = state
+        return self.cell_ids[worker], tuple(sorted(self.cell_ids[box] for box in boxes))
+
+    def decode_state(self, state):
+        """
+        Returns the (worker_xy, tuple_of_box_xy) form of a state, whatever its encoding.
+        """
+        if not self.compact_states:
+            return state
+        worker, boxes = state
+        return self.cells[worker], tuple(self.cells[box] for box in boxes)
+
+    def decode_cell(self, cell):
+        """
+        Returns the (x,y) position of a cell stored in a state, whatever its encoding.
+        """
+        if not self.compact_states:
+            return cell
+        return self.cells[cell]
+
+    def state_to_ids(self, state):
+        """
+        Returns the (worker_id, sorted_box_ids) form of a state, whatever its encoding.
+        """
+        if self.compact_states:
+            return state
+        return self.encode_state(state)
 
-        for start_pos in swapped_start_positions:
-            # For each start position, calculate costs to all other target positions.
-            for target_pos in swapped_start_positions:
-                # Skip if start and target positions are the same.
-                if start_pos == target_pos:
+    def state_from_ids(self, worker, boxes):
+        """
+        Builds a state in the puzzle's encoding from a worker id and sorted box ids.
+        Box positions stay sorted in both encodings since the cells are numbered in sorted order.
+        """
+        if self.compact_states:
+            return worker, boxes
+        return self.cells[worker], tuple(self.cells[box] for box in boxes)
+
+    def reachable_cells(self, worker, boxes):
+        """
+        Flood fill of the cells the worker can walk to without pushing any box.
+
+        Parameters:
+        - worker (int): Cell id of the worker.
+        - boxes (set of int): Cell ids of the boxes.
+
+        Returns:
+        - set: Cell ids of the reachable cells (including the worker's cell).
+        """
+        region = {worker}
+        stack = [worker]
+        while stack:
+            cell = stack.pop()
+            for neighbour in self.neighbours[cell]:
+                if neighbour >= 0 and neighbour not in region and neighbour not in boxes:
+                    region.add(neighbour)
+                    stack.append(neighbour)
+        return region
+
+    def normalize_state(self, state):
+        """
+        Replaces the worker of a state by the minimum cell of its reachable region.
+        Two states with the same boxes whose workers can walk to each other become the same state.
+        """
+        worker, boxes = self.state_to_ids(state)
+        return self.state_from_ids(min(self.reachable_cells(worker, set(boxes))), boxes)
+
+    def push_actions(self, state):
+        """
+        Determine the pushes that can be done from the given push-level (macro) state.
+
+        One flood fill gives the region the worker can reach, then every box side
+        that is in that region gives a push if the cell in front of the box is free.
+
+        Args:
+        - state (tuple): Push-level state, the canonical worker position and the positions of the boxes.
+
+        Returns:
+        - list: A list of (box, direction) pushes, box being encoded as in the state.
+        """
+        worker, boxes = self.state_to_ids(state)
+        box_set = set(boxes)
+        region = self.reachable_cells(worker, box_set)
+
+        valid_actions = []
+        for box in boxes:
+            for index, action in enumerate(self.possible_actions):
+                # The worker has to stand on the opposite side of the box.
+                behind_box = self.neighbours[box][self.opposite_actions[index]]
+                if behind_box < 0 or behind_box not in region:
                     continue
 
-                # Sort positions to ensure we don't compute cost twice for two symmetric positions.
-                sorted_positions = tuple(sorted([start_pos, target_pos]))
+                # The box must land on a free (and not taboo) cell.
+                new_box_pos = self.neighbours[box][index]
+                if new_box_pos < 0 or new_box_pos in box_set:
+                    continue
+                if self.allow_taboo_push == False and new_box_pos in self.taboo_ids:
+                    continue
+                if self.is_deadlock_push(box_set, box, new_box_pos):
+                    continue
 
-                # If the cost for the sorted positions is already computed, skip.
-                if sorted_positions in lookup_table:
+                if self.macro_moves is not None:
+                    valid_actions.append(self.macro_action(box_set, box, index))
                     continue
 
-                # Calculate moving cost between start and target positions.
-                cost = Utility.calc_moving_cost(warehouse, start_pos, target_pos)
+                # The box is encoded as in the state.
+                valid_actions.append((box if self.compact_states else self.cells[box], action))
 
-                # If there's a valid cost, update the lookup table.
-                if cost is not None:
-                    lookup_table[sorted_positions] = cost
+        return valid_actions
 
-        return lookup_table 
+    def is_deadlock_push(self, boxes, box, new_box_pos):
+        """
+        Check if pushing the box from cell id box to new_box_pos freezes a box off target
+        (see ActionStateValidation.is_freeze_deadlock) or puts it in a dead pair of the deadlock table.
+        """
+        if self.freeze_deadlocks and ActionStateValidation.is_freeze_deadlock(self.board, boxes, box, new_box_pos):
+            kind = 'freeze'
+        elif self.deadlock_table is not None and self.deadlock_table.is_deadlock(boxes, box, new_box_pos):
+            kind = 'pair'
+        else:
+            return False
+        self.stucked_case_count += 1
+        for hook in self.deadlock_hooks:
+            hook('deadlock', boxes, box, new_box_pos, kind)
+        return True
+
+    def macro_action(self, box_set, box, index):
+        """
+        The push of the box on cell id box in the direction of action index, followed by the pushes
+        it forces (see MacroMoves): along a tunnel, then into the goal room from its entrance.
+
+        Returns:
+        - tuple: A (box, direction) push, or a tuple of such pushes, boxes being encoded as in the state.
+        """
+        moves = self.macro_moves
+        pushes = [(box, index)]
+        new_box_pos = self.neighbours[box][index]
+        while True:
+            if new_box_pos == moves.entrance and pushes[-1] == (moves.outside, moves.direction):
+                room_pushes = moves.room_pushes(box_set)
+                if room_pushes is not None:
+                    pushes.extend(room_pushes)
+                break
+            if not moves.tunnel_continues(new_box_pos, index):
+                break
+            next_box_pos = self.neighbours[new_box_pos][index]
+            if next_box_pos < 0 or next_box_pos in box_set:
+                break
+            if self.allow_taboo_push == False and next_box_pos in self.taboo_ids:
+                break
+            if self.is_deadlock_push(box_set, box, next_box_pos):
+                break
+            pushes.append((new_box_pos, index))
+            new_box_pos = next_box_pos
+
+        pushes = [(cell if self.compact_states else self.cells[cell], self.possible_actions[direction]) for cell, direction in pushes]
+        return pushes[0] if len(pushes) == 1 else tuple(pushes)
+
+    @staticmethod
+    def action_pushes(action):
+        """
+        The (box, direction) pushes of a push-level action, a single push or a macro action.
+        """
+        return (action,) if isinstance(action[1], str) else action
+
+    def push_result(self, state, action):
+        """
+        Compute the push-level (macro) state after pushing a box.
+        The action must be one of self.push_actions(state).
+        The worker ends up on the previous cell of the box and is then normalized.
+        A macro action moves the same box with each of its pushes.
+        """
+        _, boxes = self.state_to_ids(state)
+        pushes = self.action_pushes(action)
+        box, _ = pushes[0]
+        last_box, direction = pushes[-1]
+        if not self.compact_states:
+            box, last_box = self.cell_ids[box], self.cell_ids[last_box]
+        new_box_pos = self.neighbours[last_box][self.possible_actions.index(direction)]
+
+        # Move the pushed box and keep the tuple sorted.
+        new_boxes = list(boxes)
+        new_boxes.remove(box)
+        insort(new_boxes, new_box_pos)
+        new_boxes = tuple(new_boxes)
+
+        worker = min(self.reachable_cells(last_box, set(new_boxes)))
+        return self.state_from_ids(worker, new_boxes)
+
+    def make_state(self, worker, boxes):
+        """
+        Builds a state in the puzzle's encoding (a ZobristState when Zobrist hashing is on)
+        from a worker id and sorted box ids.
+        """
+        state = self.state_from_ids(worker, boxes)
+        if self.zobrist:
+            state = ZobristState(*state, self.zobrist_keys.state_key(worker, boxes))
+        return state
+
+    def backward_initial_states(self):
+        """
+        Goal configurations of the backward (pull) search: every box on a target,
+        with the worker in any of the regions left free by the boxes (normalized).
+        Only the push-level (macro) puzzle can be searched backward.
+        """
+        if not self.macro:
+            raise ValueError("the backward search works on push-level states, use macro=True")
+        boxes = self.board.target_ids
+        box_set = set(boxes)
+        states = []
+        seen = set(box_set)
+        for cell in range(len(self.cells)):
+            if cell in seen:
+                continue
+            region = self.reachable_cells(cell, box_set)
+            seen.update(region)
+            states.append(self.make_state(min(region), boxes))
+        return states
+
+    def backward_actions(self, state):
+        """
+        Pulls that can be done from a push-level state.
+
+        A pull (box, direction) moves the box one cell in direction while the worker,
+        standing on that cell, steps back one more cell. It undoes the push of the box
+        from its new cell in the opposite direction.
+        """
+        worker, boxes = self.state_to_ids(state)
+        box_set = set(boxes)
+        region = self.reachable_cells(worker, box_set)
+
+        valid_actions = []
+        for box in boxes:
+            for index, action in enumerate(self.possible_actions):
+                # The worker stands next to the box and needs a free cell to step back to.
+                new_box_pos = self.neighbours[box][index]
+                if new_box_pos < 0 or new_box_pos not in region:
+                    continue
+                new_worker = self.neighbours[new_box_pos][index]
+                if new_worker < 0 or new_worker in box_set:
+                    continue
+                valid_actions.append((box if self.compact_states else self.cells[box], action))
+        return valid_actions
+
+    def backward_result(self, state, action):
+        """
+        Push-level state after a pull (see backward_actions), with the worker normalized.
+        """
+        _, boxes = self.state_to_ids(state)
+        box, direction = action
+        if not self.compact_states:
+            box = self.cell_ids[box]
+        index = self.possible_actions.index(direction)
+        new_box_pos = self.neighbours[box][index]
+        new_worker = self.neighbours[new_box_pos][index]
+
+        new_boxes = list(boxes)
+        new_boxes.remove(box)
+        insort(new_boxes, new_box_pos)
+        new_boxes = tuple(new_boxes)
+
+        return self.make_state(min(self.reachable_cells(new_worker, set(new_boxes))), new_boxes)
+
+    def forward_action(self, action):
+        """
+        The push that undoes a pull: the box is pushed back from its new cell in the opposite direction.
+        """
+        box, direction = action
+        index = self.possible_actions.index(direction)
+        box_id = box if self.compact_states else self.cell_ids[box]
+        new_box_pos = self.neighbours[box_id][index]
+        return (new_box_pos if self.compact_states else self.cells[new_box_pos],
+                self.possible_actions[self.opposite_actions[index]])
 
     def actions(self, state):   
         """
@@ -103,11 +464,18 @@ class SokobanPuzzle(search.Problem):
         - list: A list of valid actions ('Left', 'Right', 'Up', 'Down') that can be taken from the current state.
         """
 
+        if self.macro:
+            return self.push_actions(state)
+        if self.compact_states:
+            return self.compact_actions(state)
+
         # Extracting worker's position and positions of boxes from the current state.
         worker, boxes = state 
 
         # List to store valid actions.
         valid_actions = []
+        # Cell ids of the boxes, only built if a push has to be checked for a freeze deadlock.
+        box_ids = None
 
         # Loop over possible actions ('Left', 'Right', 'Up', 'Down').
         for action in self.possible_actions:
@@ -142,6 +510,12 @@ class SokobanPuzzle(search.Problem):
                     if self.allow_taboo_push == False:
                         if new_box_pos in self.taboo_cells:
                             continue
+                    # Skip the push if it freezes a box off target.
+                    if self.freeze_deadlocks or self.deadlock_table is not None:
+                        if box_ids is None:
+                            box_ids = {self.cell_ids[box] for box in boxes}
+                        if self.is_deadlock_push(box_ids, self.cell_ids[new_worker], self.cell_ids[new_box_pos]):
+                            continue
                 else:
                     continue
 
@@ -150,7 +524,61 @@ class SokobanPuzzle(search.Problem):
 
         return valid_actions
 
- 
+    def compact_actions(self, state):
+        """
+        Same as actions() for a state in the compact integer encoding.
+        """
+        worker, boxes = state 
+        valid_actions = []
+
+        for index, action in enumerate(self.possible_actions):
+            new_worker = self.neighbours[worker][index]
+
+            # Skip the action if the worker would walk into a wall.
+            if new_worker < 0:
+                continue
+
+            # If the worker pushes a box, the cell behind the box must be free (and not taboo).
+            if new_worker in boxes:
+                new_box_pos = self.neighbours[new_worker][index]
+                if new_box_pos < 0 or new_box_pos in boxes:
+                    continue
+                if self.allow_taboo_push == False and new_box_pos in self.taboo_ids:
+                    continue
+                if self.is_deadlock_push(boxes, new_worker, new_box_pos):
+                    continue
+
+            valid_actions.append(action)
+
+        return valid_actions
+
+    def compact_result(self, state, action):
+        """
+        Same as result() for a state in the compact integer encoding.
+        The box ids of the new state are kept sorted.
+        """
+        worker, boxes = state
+        index = self.possible_actions.index(action)
+        new_worker = self.neighbours[worker][index]
+
+        # Invalid move, return the original state.
+        if new_worker < 0:
+            return state
+
+        if new_worker in boxes:
+            new_box_pos = self.neighbours[new_worker][index]
+            if new_box_pos < 0 or new_box_pos in boxes:
+                return state
+            if self.allow_taboo_push == False and new_box_pos in self.taboo_ids:
+                return state
+
+            # Move the pushed box and keep the tuple sorted.
+            new_boxes = list(boxes)
+            new_boxes.remove(new_worker)
+            insort(new_boxes, new_box_pos)
+            boxes = tuple(new_boxes)
+
+        return new_worker, boxes
 
     def result(self, state, action):
         """
@@ -164,6 +592,27 @@ class SokobanPuzzle(search.Problem):
         - tuple: The new state after the action is taken, consisting of the worker's new position and new positions of boxes.
         """
 
+        if self.macro:
+            new_state = self.push_result(state, action)
+        elif self.compact_states:
+            new_state = self.compact_result(state, action)
+        else:
+            new_state = self.coordinate_result(state, action)
+
+        if new_state is state:
+            return state
+
+        # Update the key of a ZobristState with the moves of the worker and of the pushed box.
+        if self.zobrist:
+            new_state = self.zobrist_result(state, action, new_state)
+
+        return new_state
+
+    def coordinate_result(self, state, action):
+        """
+        Same as result() for a state in the (worker_xy, tuple_of_box_xy) encoding.
+        The original state is returned when the action is not valid.
+        """
         # Extract the worker's position and positions of boxes from the current state.
         worker, boxes = state
 
@@ -193,7 +642,7 @@ class SokobanPuzzle(search.Problem):
             new_box_pos = (new_worker[0] + dx, new_worker[1] + dy)
 
             # Check if the new box position is valid (i.e., not on a wall or another box).
-            if self.walls not in new_box_pos and new_box_pos not in boxes:
+            if new_box_pos not in self.walls and new_box_pos not in boxes:
                 # If taboo pushes are not allowed, check if the new box position would be on a taboo cell.
                 if self.allow_taboo_push == False:
                     if new_box_pos in self.taboo_cells:
@@ -209,38 +658,59 @@ class SokobanPuzzle(search.Problem):
             # If the worker doesn't push a box, the box positions remain unchanged.
             new_boxes = boxes
 
-        # Update the worker's position.
-        worker = new_worker
-        boxes = new_boxes
-        self.boxes = boxes
-        self.worker = worker
-
-        # If in observer mode, show updates in the environment.
-        if self.observer_mode:
-            if self.stop:
-                input("Press Enter to continue...")
-                self.stop = False
-            wh = Utility.build_wh(self.walls, self.targets, self.boxes, self.worker)
-            time.sleep(0.01)
-            clear_output(wait=True)
-            print("prev_heur:", self.prev_heur, ", self.cost:", self.cost, ", stucked:", self.stucked_case_count, ", box_can_not_go_target:", self.box_can_not_go_target_count)
-            print(wh)
-
         # Return the new state.
         return new_worker, new_boxes
 
+    def zobrist_result(self, state, action, new_state):
+        """
+        Builds the ZobristState of new_state, the result of action from the ZobristState state.
+        The key is updated from the key of state with the worker move and the box push only.
+        """
+        worker, boxes = new_state
+        cell_id = self.zobrist_cell_id
+        keys = self.zobrist_keys
+        key = state.key ^ keys.worker_keys[cell_id(state.worker)] ^ keys.worker_keys[cell_id(worker)]
+
+        # A box moved: it left the cell pushed into and landed one cell further
+        # (or, for a macro action, one cell after the box cell of the last push).
+        if boxes is not state.boxes:
+            if self.macro:
+                pushes = self.action_pushes(action)
+                old_box = cell_id(pushes[0][0])
+                box, direction = pushes[-1]
+            else:
+                box, direction = worker, action
+                old_box = cell_id(box)
+            new_box = self.neighbours[cell_id(box)][self.possible_actions.index(direction)]
+            key ^= keys.box_keys[old_box] ^ keys.box_keys[new_box]
+
+        return ZobristState(worker, boxes, key)
 
+    def heuristic_cache(self, h):
+        """
+        Returns the bounded LRU cache (state -> value) of the pure heuristic h(board, state).
+        The values only depend on the state, so they can be shared by all the nodes of that state.
+        """
+        cache = self.heuristic_caches.get(h)
+        if cache is None:
+            cache = self.heuristic_caches[h] = search.LRUCache(self.heuristic_cache_size)
+        return cache
 
     # Method to check if the goal state is achieved.
     def goal_test(self, state):
         _, boxes = state
+        if self.compact_states:
+            return boxes == self.goal_ids
         return set(boxes) == set(self.goal)
     
     # Method to calculate the path cost.
     def path_cost(self, c, state1, action, state2):
         """Return the cost of a solution path that arrives at state2 from
-        state1 via action, assuming cost c to get up to state1."""
+        state1 via action, assuming cost c to get up to state1.
+        A macro action costs its number of pushes."""
         self.cost = c
+        if self.macro_moves is not None:
+            return c + len(self.action_pushes(action))
         return c + 1
     
     
@@ -254,8 +724,9 @@ def check_action_seq(warehouse, action_seq):
     Important notes:
       - a legal sequence of actions does not necessarily solve the puzzle.
       - an action is legal even if it pushes a box onto a taboo cell.
+      - the warehouse is not modified (see SequenceValidator to check many sequences).
         
-    @param warehouse: a valid Warehouse object
+    @param warehouse: a valid Warehouse (or FrozenWarehouse) object
 
     @param action_seq: a sequence of legal actions.
            For example, ['Left', 'Down', Down','Right', 'Up', 'Down']
@@ -270,41 +741,9 @@ def check_action_seq(warehouse, action_seq):
                string returned by the method  Warehouse.__str__()
     '''
     
-    def is_wall(pos):
-        return pos in warehouse.walls
-
-    # Helper function to check if a given position is a box
-    def is_box(pos):
-        return pos in warehouse.boxes
-
-    # Dictionary to map action to coordinates change
-    move_dict = {
-        'Left': (-1, 0),
-        'Right': (1, 0),
-        'Up': (0, -1),
-        'Down': (0, 1)
-    }
-   
-    # Iterate through each action in the action sequence
-    for action in action_seq:
-        dx, dy = move_dict[action]
-        worker_next_pos = (warehouse.worker[0] + dx, warehouse.worker[1] + dy)
-        box_pushed_pos = (worker_next_pos[0] + dx, worker_next_pos[1] + dy)
-
-        # Check for illegal moves
-        if is_wall(worker_next_pos):
-            return 'Failure'
-        elif is_box(worker_next_pos):
-            if is_wall(box_pushed_pos) or is_box(box_pushed_pos):
-                return 'Failure'
-            else:
-                # Update box's position after being pushed
-                warehouse.boxes.remove(worker_next_pos)
-                warehouse.boxes.append(box_pushed_pos)
-
-        # Update worker's position
-        warehouse.worker = worker_next_pos
-
-    # Return the final state of the warehouse
-    return str(warehouse)
+    # The warehouse is replayed on a copy of its boxes, it is left unchanged.
+    verdict = SequenceValidator(warehouse).validate(action_seq, render=True)
+    if not verdict['valid']:
+        return 'Failure'
+    return verdict['warehouse']
     
\ No newline at end of file
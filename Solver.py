@@ -1,5 +1,6 @@
 import time
 import search
+import ParallelSearch
 from Heuristics import Heuristics
 from SokobanPuzzle import SokobanPuzzle
 
@@ -10,69 +11,101 @@ class Solver:
     puzzle = None
     solution = None
     start_time = None
+    stats = None
+
+    # Search engines that can be selected with the 'engine' argument.
+    ENGINES = {
+        'best_first': search.best_first_graph_search,
+        'astar': search.astar_graph_search,
+        'ida': search.ida_star_search,
+        # Forward push search meeting a backward pull search from the goal (push_level only).
+        'bidirectional': search.bidirectional_search,
+        # Hash-distributed searches over one worker process per core.
+        'parallel_best_first': ParallelSearch.parallel_best_first_search,
+        'parallel_astar': ParallelSearch.parallel_astar_search,
+    }
     
     @classmethod
-    def solve_sokoban_elem(cls, warehouse, allow_taboo_push=False, h=None, observer_mode=False):
+    def solve_sokoban_elem(cls, warehouse, allow_taboo_push=False, h=None, observer_mode=False, compact_states=False,
+                           engine='best_first', time_limit=None, node_limit=None, memory_limit=None, board_cache=None, zobrist=False,
+                           transposition_table=None, freeze_deadlocks=True, pair_deadlocks=None, events=None):
         '''    
         Solve using elementary actions the Sokoban puzzle provided.
 
         @param warehouse: a valid Warehouse object
+        @param engine: name of the search engine in Solver.ENGINES, see solve_sokoban_macro
+                       ('bidirectional' only searches over pushes, it raises a ValueError here)
+        @param time_limit, node_limit, memory_limit: limits of the search, see solve_sokoban_macro
+        @param board_cache: optional BoardCache reusing the precomputation of known layouts
+        @param zobrist: use states carrying an incrementally updated Zobrist key as their hash
+        @param transposition_table: optional TranspositionTable used instead of the unbounded
+                                    explored set, to cap the memory of the explored states
+                                    (the frontier nodes and their parent chains are not bounded)
+                                    (with 'ida' it cuts the repeated sub-searches)
+        @param freeze_deadlocks: prune the pushes that freeze a box off target
+        @param pair_deadlocks: prune the pushes that make a dead pair of boxes, with the two-box
+                               deadlock table built before the search ('wait') or in a
+                               background thread ('background')
+        @param events: optional SearchEvents receiving the events of the search (see SearchEvents),
+                       observer_mode subscribes a NotebookViewer to it
 
         @return
             If puzzle cannot be solved return 'Impossible'
+            If a limit was reached before a solution was found return ['Timeout']
+                (the counters of the partial search are in Solver.stats)
             If a solution was found, return a list of elementary actions that solves
                 the given puzzle coded with 'Left', 'Right', 'Up', 'Down'
                 For example, ['Left', 'Down', Down','Right', 'Up', 'Down']
                 If the puzzle is already in a goal state, simply return []
         '''
 
-        global puzzle
-        global start_time
-        global solution 
-
-
-        start_time = time.time()
+        cls.start_time = time.time()
+        cls.stats = None
 
         # Check if already solved
         if set(warehouse.boxes) == set(warehouse.targets):
             return []
 
-        macro_moves = [] 
-
-       # allow_taboo_push = True
-
          # execute best_first_graph_search to solve the puzzle
         heuristic = Heuristics.heuristic83Lookup
         if h != None:
             heuristic = h
 
-        cls.puzzle = SokobanPuzzle(warehouse, allow_taboo_push = allow_taboo_push, show_wh=show_wh,show_taboo_cells=show_taboo_cells , observer_mode=observer_mode)
-        M = search.best_first_graph_search(cls.puzzle, heuristic)
-       # M = search.astar_graph_search(puzzle, heuristic)
-      #  M = search.uniform_cost_search(puzzle)
-       # M = search.depth_first_graph_search(puzzle)
-       # M = search.breadth_first_graph_search(puzzle)
-      #  depth_first_graph_search(problem):
+        if engine == 'bidirectional':
+            raise ValueError("the bidirectional engine searches over pushes, use solve_sokoban_macro with push_level=True")
 
+        cls.puzzle = SokobanPuzzle(warehouse, allow_taboo_push = allow_taboo_push, observer_mode=observer_mode, compact_states=compact_states, board_cache=board_cache, zobrist=zobrist, freeze_deadlocks=freeze_deadlocks, pair_deadlocks=pair_deadlocks, events=events)
 
-     # breadth_first_graph_search(problem):
+        # Define a wrapper function for the heuristic that provides the puzzle
+        def heuristic_wrapper(n):
+            return heuristic(cls.puzzle, n)
 
+        # The batched form of the heuristic, if it has one, evaluates all the children of an expansion at once.
+        heuristic_batch = Heuristics.BATCH.get(heuristic)
+        if heuristic_batch is not None:
+            heuristic_wrapper.batch = lambda nodes: heuristic_batch(cls.puzzle, nodes)
 
-      #  M = search.astar_graph_search(puzzle, heuristic)
-       # M = search.astar_graph_search(SokobanPuzzle(warehouse, allow_taboo_push = allow_taboo_push), heuristic)
+        cls.stats = search.SearchStats()
+        M = cls.ENGINES[engine](cls.puzzle, heuristic_wrapper, stats=cls.stats,
+                                time_limit=time_limit, node_limit=node_limit, memory_limit=memory_limit,
+                                explored=transposition_table)
+
+        if M == 'timeout':
+            print("Search stopped, {} limit reached".format(cls.stats.limit_reached))
+            return ['Timeout']
 
         if M is None:
             print("M is None")
             return ['Impossible']
 
-
-
-        cls.solution = M.solution()
-        return solution
+        cls.solution = M
+        return M.solution()
 
 
     @classmethod
-    def solve_sokoban_macro(cls, warehouse, allow_taboo_push=False, h=None, show_wh=False, show_taboo_cells=False, observer_mode=False):
+    def solve_sokoban_macro(cls, warehouse, allow_taboo_push=False, h=None, show_wh=False, show_taboo_cells=False, observer_mode=False, compact_states=False, push_level=False, engine='best_first',
+                            time_limit=None, node_limit=None, memory_limit=None, board_cache=None, zobrist=False,
+                            transposition_table=None, freeze_deadlocks=True, pair_deadlocks=None, push_macros=False, events=None):
 
         '''    
         Solve using macro actions the puzzle defined in the warehouse passed as
@@ -85,16 +118,45 @@ class Solver:
         goes the box at row 12 and column 4 and pushes it down.
 
         @param warehouse: a valid Warehouse object
+        @param compact_states: search over the compact integer encoding of the states
+        @param push_level: search over pushes from worker-reachability-normalized states
+                           instead of elementary worker steps
+        @param engine: name of the search engine in Solver.ENGINES ('best_first' is greedy
+                       on the heuristic, 'astar' adds the path cost, 'ida' is iterative
+                       deepening A* in linear memory, 'bidirectional' meets a backward
+                       pull search from the goal and needs push_level, 'parallel_best_first'
+                       and 'parallel_astar' share the states between worker processes)
+        @param time_limit: search time budget in seconds
+        @param node_limit: maximum number of expanded nodes
+        @param memory_limit: maximum resident set size of the process in MB
+        @param board_cache: optional BoardCache reusing the precomputation of known layouts
+        @param zobrist: use states carrying an incrementally updated Zobrist key as their hash
+        @param transposition_table: optional TranspositionTable used instead of the unbounded
+                                    explored set, to cap the memory of the explored states
+                                    (the frontier nodes and their parent chains are not bounded)
+                                    (with 'ida' it cuts the repeated sub-searches)
+        @param freeze_deadlocks: prune the pushes that freeze a box off target
+        @param pair_deadlocks: prune the pushes that make a dead pair of boxes, with the two-box
+                               deadlock table built before the search ('wait') or in a
+                               background thread ('background')
+        @param push_macros: with push_level, chain the forced pushes of a box along a tunnel
+                             and bring the boxes pushed onto the goal room entrance to their
+                             target in one action (see MacroMoves)
+        @param events: optional SearchEvents receiving the events of the search (see SearchEvents),
+                       observer_mode subscribes a NotebookViewer to it
 
         @return
             If puzzle cannot be solved return the string 'Impossible'
+            If a limit was reached before a solution was found return ['Timeout']
+                (the counters of the partial search are in Solver.stats)
             Otherwise return M a sequence of macro actions that solves the puzzle.
             If the puzzle is already in a goal state, simply return []
         ''' 
         
 
 
-        start_time = time.time()
+        cls.start_time = time.time()
+        cls.stats = None
 
         # Check if already solved
         if set(warehouse.boxes) == set(warehouse.targets):
@@ -109,14 +171,26 @@ class Solver:
         if h != None:
             heuristic = h
 
-        cls.puzzle = SokobanPuzzle(warehouse, allow_taboo_push = allow_taboo_push, show_wh=show_wh,show_taboo_cells=show_taboo_cells, observer_mode=observer_mode )
+        if engine == 'bidirectional' and not push_level:
+            raise ValueError("the bidirectional engine searches over pushes, use push_level=True")
+
+        cls.puzzle = SokobanPuzzle(warehouse, allow_taboo_push = allow_taboo_push, show_wh=show_wh,show_taboo_cells=show_taboo_cells, observer_mode=observer_mode, compact_states=compact_states, macro=push_level, board_cache=board_cache, zobrist=zobrist, freeze_deadlocks=freeze_deadlocks, pair_deadlocks=pair_deadlocks, push_macros=push_macros, events=events)
         
          # Define a wrapper function for the heuristic that provides the puzzle
         def heuristic_wrapper(n):
-            return h(cls.puzzle, n)
-
-        # Use the wrapper function as the heuristic for the search algorithm
-        M = search.best_first_graph_search(cls.puzzle, heuristic_wrapper)
+            return heuristic(cls.puzzle, n)
+
+        # The batched form of the heuristic, if it has one, evaluates all the children of an expansion at once.
+        heuristic_batch = Heuristics.BATCH.get(heuristic)
+        if heuristic_batch is not None:
+            heuristic_wrapper.batch = lambda nodes: heuristic_batch(cls.puzzle, nodes)
+
+        # Use the wrapper function as the heuristic for the search algorithm,
+        # the search counters are kept in cls.stats.
+        cls.stats = search.SearchStats()
+        M = cls.ENGINES[engine](cls.puzzle, heuristic_wrapper, stats=cls.stats,
+                                time_limit=time_limit, node_limit=node_limit, memory_limit=memory_limit,
+                                explored=transposition_table)
         
       #  M = search.best_first_graph_search(cls.puzzle, heuristic)
        # M = search.astar_graph_search(puzzle, heuristic)
@@ -132,22 +206,35 @@ class Solver:
       #  M = search.astar_graph_search(puzzle, heuristic)
        # M = search.astar_graph_search(SokobanPuzzle(warehouse, allow_taboo_push = allow_taboo_push), heuristic)
 
+        if M == 'timeout':
+            print("Search stopped, {} limit reached".format(cls.stats.limit_reached))
+            return ['Timeout']
+
         if M is None:
             print("M is None")
             return ['Impossible']
 
 
+        cls.solution = M
+
+        # In push-level search every action already is a (box, direction) push,
+        # or a macro action made of several pushes.
+        if push_level:
+            for action in M.solution():
+                for box, direction in cls.puzzle.action_pushes(action):
+                    macro_moves.append((Utility.swap_coordinates(cls.puzzle.decode_cell(box)), direction))
+            return macro_moves
+
         m_acts = M.path()
 
         actions = [p.action for p in m_acts] 
-        states = [p.state[0] for p in m_acts] 
 
-        prev_boxes_pos = m_acts[0].state[1]
-        for m_act in m_acts:          
-            worker_pos = m_act.state[0]
-            cur_boxes_pos = m_act.state[1]
+        # Decode the states in case the search used the compact encoding.
+        states = [cls.puzzle.decode_state(p.state) for p in m_acts] 
+
+        prev_boxes_pos = states[0][1]
+        for m_act, (worker_pos, cur_boxes_pos) in zip(m_acts, states):          
             if prev_boxes_pos != cur_boxes_pos: 
                 macro_moves.append((Utility.swap_coordinates(worker_pos), m_act.action))
             prev_boxes_pos = cur_boxes_pos
-        cls.solution = M
         return macro_moves
\ No newline at end of file
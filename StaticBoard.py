@@ -0,0 +1,122 @@
+from Utility import Utility
+
+
+class StaticBoard:
+    """
+    Everything about a warehouse that does not change while the puzzle is solved:
+    walls, targets, inside cells, dead squares and the distances between cells.
+
+    The cells inside the warehouse are numbered once (cell ids, in sorted (x,y) order)
+    so that the search can use flat arrays indexed by cell id instead of scanning lists.
+    """
+
+    # Order of the actions used by the neighbour tables.
+    ACTIONS = ['Left', 'Right', 'Up', 'Down']
+    MOVES = {'Left': (-1, 0), 'Right': (1, 0), 'Up': (0, -1), 'Down': (0, 1)}
+
+    # Push distance of a box that cannot reach a target (large but finite, so it can be summed).
+    NO_PATH = 1 << 20
+
+    def __init__(self, warehouse, precomputed=None):
+        """
+        Precompute the static board of a warehouse.
+
+        Parameters:
+        - warehouse: A valid Warehouse object.
+        - precomputed: Optional dictionary with the expensive values already computed for the same
+                       walls and targets (taboo_map, x_size, y_size, cells, taboo_cells, distance_matrix,
+                       push_distances), as loaded by BoardCache.
+        """
+        # Walls and targets as sets for O(1) membership tests.
+        self.walls = frozenset(warehouse.walls)
+        self.targets = frozenset(warehouse.targets)
+
+        if precomputed is not None:
+            self.taboo_map, self.x_size, self.y_size = precomputed['taboo_map'], precomputed['x_size'], precomputed['y_size']
+            self.taboo_cells = precomputed['taboo_cells']
+            self.cells = precomputed['cells']
+            self.inside_cells = set(Utility.swap_coordinates(pos) for pos in self.cells)
+            self.cell_ids = {cell: cell_id for cell_id, cell in enumerate(self.cells)}
+            self.distance_matrix = precomputed['distance_matrix']
+        else:
+            # Taboo cells from the corner and wall-line rules.
+            self.taboo_map, self.x_size, self.y_size, self.inside_cells = Utility.taboo_cells(warehouse, get_additional_values=True)
+            self.taboo_cells = Utility.find_taboo_cells(self.taboo_map)
+
+            # Number the inside cells and compute the walking distance between every pair of cells.
+            self.cells = sorted(Utility.swap_coordinates(pos) for pos in self.inside_cells)
+            self.cell_ids, self.distance_matrix = Utility.bfs_distance_matrix(self.cells)
+
+        # For each cell id, the id of the neighbouring cell for each action in ACTIONS (-1 for a wall).
+        self.neighbours = []
+        for (x, y) in self.cells:
+            self.neighbours.append(tuple(self.cell_ids.get((x + dx, y + dy), -1)
+                                         for dx, dy in (self.MOVES[action] for action in self.ACTIONS)))
+
+        # Index of the opposite action of each action in ACTIONS.
+        self.opposite_actions = [self.ACTIONS.index(action) for action in ['Right', 'Left', 'Down', 'Up']]
+
+        # Targets as cell ids, and a flag per cell id.
+        self.target_ids = tuple(sorted(self.cell_ids[target] for target in self.targets))
+        self.is_target = bytearray(len(self.cells))
+        for target_id in self.target_ids:
+            self.is_target[target_id] = 1
+
+        # Number of pushes from every cell to every target (ignoring the other boxes).
+        self.push_distances = precomputed['push_distances'] if precomputed is not None else self.find_push_distances()
+
+        # Dead squares: cells from which a box can never reach a target,
+        # plus the taboo cells of the corner and wall-line rules.
+        dead_ids = set(cell_id for cell_id in range(len(self.cells)) if min(self.push_distances[cell_id]) == self.NO_PATH)
+        dead_ids.update(self.cell_ids[cell] for cell in self.taboo_cells if cell in self.cell_ids)
+        self.dead_ids = frozenset(dead_ids)
+        self.dead_squares = frozenset(self.cells[cell_id] for cell_id in dead_ids)
+        self.is_dead = bytearray(len(self.cells))
+        for cell_id in dead_ids:
+            self.is_dead[cell_id] = 1
+
+        # NumPy arrays of the vectorized heuristics, built on first use (see Heuristics.numpy_tables).
+        self.numpy_tables = None
+
+    def find_push_distances(self):
+        """
+        Reverse-pull BFS from each target.
+
+        A box on cell c can be pulled to the neighbour n = c + d when the worker can stand on n
+        and step back to n + d. The number of pulls needed to bring a box from a target to a cell
+        is the number of pushes needed to bring it back from that cell to the target
+        (when no other box is in the way).
+
+        Returns:
+        - list: For each cell id, a tuple with the number of pushes to each target of target_ids.
+                NO_PATH when the box cannot be pushed from that cell to that target.
+        """
+        n_cells = len(self.cells)
+        distances = [[self.NO_PATH] * len(self.target_ids) for _ in range(n_cells)]
+
+        for target_index, target_id in enumerate(self.target_ids):
+            distances[target_id][target_index] = 0
+            frontier = [target_id]
+            pulls = 0
+            while frontier:
+                pulls += 1
+                next_frontier = []
+                for cell_id in frontier:
+                    for index in range(len(self.ACTIONS)):
+                        new_box_pos = self.neighbours[cell_id][index]
+                        if new_box_pos < 0 or distances[new_box_pos][target_index] != self.NO_PATH:
+                            continue
+                        # The worker pulls from new_box_pos and steps further in the same direction.
+                        if self.neighbours[new_box_pos][index] < 0:
+                            continue
+                        distances[new_box_pos][target_index] = pulls
+                        next_frontier.append(new_box_pos)
+                frontier = next_frontier
+
+        return [tuple(row) for row in distances]
+
+    def distance(self, start_id, goal_id):
+        """
+        Walking distance between two cell ids (-1 if the goal cannot be reached).
+        """
+        return self.distance_matrix[start_id * len(self.cells) + goal_id]
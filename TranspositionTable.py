@@ -0,0 +1,161 @@
+class TranspositionTable:
+    '''
+    Fixed-capacity table of search states, keyed by the state hash.
+
+    Each entry keeps the state, the best path cost g found for it, the parent state and a depth,
+    in a slot chosen by hash(state). When two states fall in the same slot the replacement
+    policy decides which one stays, so the memory used by the table never grows past its
+    capacity and duplicate detection degrades gracefully instead of running out of memory.
+    Only the explored states are bounded this way: with the graph searches the frontier still
+    grows, and each frontier node keeps its chain of parent nodes up to the root.
+
+    The depth tells how much search an entry stands for. The graph searches store the depth
+    of the node in the search tree (a best-first search keeps reaching the deep states of the
+    region it is working in); IDA* stores the depth left to its cost bound, as in game-tree search.
+
+    Replacement policies:
+    - 'always_replace': the newest entry always takes the slot.
+    - 'depth_preferred': the entry with the largest depth keeps the slot.
+    - 'two_tier': each bucket has a depth-preferred slot and an always-replace slot;
+      an entry pushed out of the first slot falls back to the second one.
+
+    The table can be used instead of the explored set of the graph searches of search.py
+    ('state in table' and table.add(state) behave like a set) and by the IDA* engine.
+    '''
+
+    POLICIES = ('always_replace', 'depth_preferred', 'two_tier')
+
+    def __init__(self, capacity=1000000, policy='two_tier'):
+        '''
+        Parameters:
+        - capacity: Number of entries of the table.
+        - policy: Replacement policy, one of TranspositionTable.POLICIES.
+        '''
+        if policy not in TranspositionTable.POLICIES:
+            raise ValueError('unknown replacement policy: {}'.format(policy))
+        if capacity < (2 if policy == 'two_tier' else 1):
+            raise ValueError('capacity is too small')
+
+        self.policy = policy
+        self.capacity = capacity
+        # Two slots per bucket for the two-tier policy, one otherwise.
+        self.slots_per_bucket = 2 if policy == 'two_tier' else 1
+        self.buckets = capacity // self.slots_per_bucket
+
+        self.states = [None] * (self.buckets * self.slots_per_bucket)
+        self.costs = [0] * len(self.states)
+        self.parents = [None] * len(self.states)
+        self.depths = [0] * len(self.states)
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.rejections = 0
+        self.size = 0
+
+    def find(self, state):
+        '''
+        Slot index of state, or -1 if the state is not in the table.
+        '''
+        first = (hash(state) % self.buckets) * self.slots_per_bucket
+        for slot in range(first, first + self.slots_per_bucket):
+            if self.states[slot] is not None and self.states[slot] == state:
+                return slot
+        return -1
+
+    def lookup(self, state):
+        '''
+        Returns:
+        - tuple: (g, parent state, depth) stored for state, None if the state is not in the table.
+        '''
+        slot = self.find(state)
+        if slot < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.costs[slot], self.parents[slot], self.depths[slot]
+
+    def __contains__(self, state):
+        return self.lookup(state) is not None
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, g=0, parent=None, depth=0):
+        '''
+        Set-like alias of store().
+        '''
+        return self.store(state, g, parent, depth)
+
+    def store(self, state, g, parent=None, depth=0):
+        '''
+        Store (or improve) the entry of a state.
+
+        Parameters:
+        - state: The search state.
+        - g: Path cost of the state.
+        - parent: Parent state (None for the root).
+        - depth: Depth of the entry, used by the depth-preferred replacement.
+
+        Returns:
+        - bool: True if the state is in the table after the call.
+        '''
+        slot = self.find(state)
+        if slot >= 0:
+            # Same state: keep the best path to it and the largest depth.
+            if g < self.costs[slot]:
+                self.costs[slot] = g
+                self.parents[slot] = parent
+            if depth > self.depths[slot]:
+                self.depths[slot] = depth
+            return True
+
+        first = (hash(state) % self.buckets) * self.slots_per_bucket
+        if self.policy == 'always_replace':
+            self.put(first, state, g, parent, depth)
+        elif self.policy == 'depth_preferred':
+            if self.states[first] is not None and self.depths[first] > depth:
+                self.rejections += 1
+                return False
+            self.put(first, state, g, parent, depth)
+        else:
+            # Two-tier: the new entry takes the depth-preferred slot if it is at least as deep,
+            # the entry it replaces moves down to the always-replace slot.
+            if self.states[first] is None or depth >= self.depths[first]:
+                if self.states[first] is not None:
+                    self.put(first + 1, self.states[first], self.costs[first], self.parents[first], self.depths[first])
+                    self.states[first] = None
+                    self.size -= 1
+                self.put(first, state, g, parent, depth)
+            else:
+                self.put(first + 1, state, g, parent, depth)
+        self.stores += 1
+        return True
+
+    def put(self, slot, state, g, parent, depth):
+        if self.states[slot] is None:
+            self.size += 1
+        else:
+            self.evictions += 1
+        self.states[slot] = state
+        self.costs[slot] = g
+        self.parents[slot] = parent
+        self.depths[slot] = depth
+
+    def clear(self):
+        '''
+        Remove all the entries (the counters are kept).
+        '''
+        # New lists instead of a loop over the slots, IDA* clears the table at every iteration.
+        # The costs and depths are only read in occupied slots, they are overwritten by put.
+        self.states = [None] * len(self.states)
+        self.parents = [None] * len(self.states)
+        self.size = 0
+
+    def stats(self):
+        '''
+        Dictionary of the table counters.
+        '''
+        return {'tt_size': self.size, 'tt_hits': self.hits, 'tt_misses': self.misses, 'tt_stores': self.stores,
+                'tt_evictions': self.evictions, 'tt_rejections': self.rejections}
@@ -1,3 +1,4 @@
+from array import array
 import search
 from search import astar_graph_search as astar_graph 
 from sokoban import Warehouse
@@ -555,7 +556,54 @@ class Utility:
             return None
 
     @staticmethod
-    def find_taboo_cells(s): 
+    def bfs_distance_matrix(cells):
+        """
+        Calculate the walking distance between every pair of cells with one BFS per cell.
+
+        Parameters:
+        - cells: A list of (x,y) positions of all the cells inside the warehouse.
+                 The index of a cell in this list is used as its cell id.
+
+        Returns:
+        - A dictionary mapping each (x,y) position to its cell id.
+        - A flat integer array of size len(cells)**2 where the entry at
+          index (start_id * len(cells) + goal_id) is the moving cost from start to goal,
+          or -1 if the goal cannot be reached from the start.
+        """
+        # Number the cells once so that the BFS can work on integer ids.
+        cell_ids = {cell: cell_id for cell_id, cell in enumerate(cells)}
+        n_cells = len(cells)
+
+        # Precompute the neighbouring cell ids of every cell (walls and outside cells are not in cell_ids).
+        neighbours = []
+        for (x, y) in cells:
+            adjacent = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+            neighbours.append([cell_ids[pos] for pos in adjacent if pos in cell_ids])
+
+        # Dense distance matrix, -1 marks unreachable pairs.
+        distances = array('i', [-1]) * (n_cells * n_cells)
+
+        for start_id in range(n_cells):
+            row = start_id * n_cells
+            distances[row + start_id] = 0
+
+            # Level by level BFS from the start cell.
+            frontier = [start_id]
+            cost = 0
+            while frontier:
+                cost += 1
+                next_frontier = []
+                for cell_id in frontier:
+                    for neighbour_id in neighbours[cell_id]:
+                        if distances[row + neighbour_id] < 0:
+                            distances[row + neighbour_id] = cost
+                            next_frontier.append(neighbour_id)
+                frontier = next_frontier
+
+        return cell_ids, distances
+
+    @staticmethod
+    def find_taboo_cells(s):
         """
         Extracts the coordinates of 'X' characters from a given string representation of the warehouse.
 
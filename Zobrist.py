@@ -0,0 +1,73 @@
+import random
+
+
+class ZobristKeys:
+    """
+    Random 64-bit keys for each (cell id, piece) of a board, piece being the worker or a box.
+
+    The key of a state is the XOR of the keys of its pieces, so moving a piece
+    only takes two XORs: one to remove it from its old cell and one to add it on the new cell.
+    """
+
+    def __init__(self, n_cells, seed=0):
+        """
+        Parameters:
+        - n_cells: Number of cells of the board.
+        - seed: Seed of the random keys (the same seed gives the same keys).
+        """
+        rng = random.Random(seed)
+        self.worker_keys = [rng.getrandbits(64) for _ in range(n_cells)]
+        self.box_keys = [rng.getrandbits(64) for _ in range(n_cells)]
+
+    def state_key(self, worker, boxes):
+        """
+        Full key of a state given as cell ids (used once for the initial state).
+        """
+        key = self.worker_keys[worker]
+        for box in boxes:
+            key ^= self.box_keys[box]
+        return key
+
+
+class ZobristState:
+    """
+    A (worker, boxes) search state that carries its Zobrist key.
+
+    It unpacks and indexes like the (worker, boxes) tuple it replaces, but hashing and
+    comparing use the stored key instead of the box positions, so the explored set and
+    the frontier look up states in O(1) whatever the number of boxes.
+
+    Two states are equal when they have the same worker cell and the same set of box cells
+    (the key only depends on these, so states that list the same boxes in a different order
+    are the same state). The keys are compared first, the positions are only compared when
+    the keys match, so two different states with the same key are never merged.
+    A ZobristState is never equal to a plain (worker, boxes) tuple, whose hash is different.
+    """
+    __slots__ = ('worker', 'boxes', 'key')
+
+    def __init__(self, worker, boxes, key):
+        self.worker = worker
+        self.boxes = boxes
+        self.key = key
+
+    def __iter__(self):
+        yield self.worker
+        yield self.boxes
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return (self.worker, self.boxes)[index]
+
+    def __hash__(self):
+        return self.key
+
+    def __eq__(self, other):
+        if not isinstance(other, ZobristState):
+            return NotImplemented
+        return self.key == other.key and self.worker == other.worker and \
+            (self.boxes == other.boxes or set(self.boxes) == set(other.boxes))
+
+    def __repr__(self):
+        return repr((self.worker, self.boxes))
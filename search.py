@@ -28,6 +28,9 @@ import sys
 assert sys.version_info >= (3, 5)
 
 import itertools
+import collections
+import os
+import time
 
 
 # momoization decorator
@@ -41,6 +44,121 @@ def memoize(fn):
     return memoized_fn
 
 
+class LRUCache:
+    """
+    A dictionary with a bounded number of entries.
+    When it is full, the least recently used entry is dropped.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the value stored for key (and mark it as recently used), or default."""
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store value for key, dropping the least recently used entry if the cache is full."""
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SearchStats:
+    """
+    Counters filled in by the search functions while they run:
+    number of nodes expanded and generated, largest frontier size and elapsed time.
+    Pass an instance with the 'stats' argument to read them after the search.
+    """
+    def __init__(self):
+        self.expanded = 0
+        self.generated = 0
+        self.frontier_max = 0
+        self.elapsed_time = 0.0
+        self.start_time = None
+        # Name of the limit that stopped the search ('time', 'nodes' or 'memory'), None otherwise.
+        self.limit_reached = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def stop(self, limit_reached=None):
+        self.elapsed_time = time.perf_counter() - self.start_time
+        self.limit_reached = limit_reached
+
+    @property
+    def nodes_per_second(self):
+        """Expanded nodes per second of search."""
+        return self.expanded / self.elapsed_time if self.elapsed_time > 0 else 0.0
+
+    def as_dict(self):
+        return {'expanded': self.expanded, 'generated': self.generated,
+                'frontier_max': self.frontier_max, 'search_time': round(self.elapsed_time, 3),
+                'nodes_per_second': round(self.nodes_per_second), 'limit_reached': self.limit_reached}
+
+
+# Number of expanded nodes between two checks of the memory limit (reading the memory usage is a system call).
+MEMORY_CHECK_INTERVAL = 1000
+
+
+def memory_usage():
+    """
+    Current resident set size of the process in MB.
+    Falls back on the peak resident set size where /proc is not available, None if neither is.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def limit_reached(stats, time_limit=None, node_limit=None, memory_limit=None):
+    """
+    Check the limits of a search.
+
+    Parameters:
+    - stats: SearchStats of the running search.
+    - time_limit: Search time budget in seconds.
+    - node_limit: Maximum number of expanded nodes.
+    - memory_limit: Maximum resident set size of the process in MB (checked every MEMORY_CHECK_INTERVAL expansions).
+
+    Returns:
+    - str: 'nodes', 'time' or 'memory' for the first limit reached, None if the search can go on.
+    """
+    if node_limit is not None and stats.expanded >= node_limit:
+        return 'nodes'
+    if time_limit is not None and time.perf_counter() - stats.start_time >= time_limit:
+        return 'time'
+    if memory_limit is not None and stats.expanded % MEMORY_CHECK_INTERVAL == 0:
+        usage = memory_usage()
+        if usage is not None and usage >= memory_limit:
+            return 'memory'
+    return None
+
+
 def update(x, **entries):
     """Update a dict; or an object with slots; according to entries.
     >>> update({'a': 1}, a=10, b=20)
@@ -85,7 +203,6 @@ def LIFOQueue():
     return []
 
 
-import collections # for dequeue
 class FIFOQueue(collections.deque):
     """
     A First-In-First-Out Queue.
@@ -97,21 +214,36 @@ class FIFOQueue(collections.deque):
 
 
 import heapq
+# placeholder for the entries deleted from a PriorityQueue
+_REMOVED = object()
+
 class PriorityQueue(Queue):
     """
     A queue in which the minimum  element (as determined by f) is returned first.
     The item with minimum f(x) is returned first
+    The queue keeps an index  item -> heap entry  so that membership tests,
+    lookups and removals do not scan the heap. Removed entries are only 
+    marked as removed (lazy deletion) and are skipped by pop.
+    An item appended while an equal item is queued replaces that item.
     """
     def __init__(self, f=lambda x: x):
-        self.heap = []  # list of pairs  (f(item), counter_value, item)
+        self.heap = []  # list of entries  [f(item), counter_value, item]
         self.f = f
         self.counter = itertools.count() # unique sequence count
         # counter_value is used to break ties between items that
         # have the same 'f' value
+        self.entries = {} # index  item -> entry  of the items currently queued
         
-    def append(self, item):
-        # thw pair  (f(item), counter_value, item)  is pushed on the internal heapq
-        heapq.heappush(self.heap, (self.f(item),next(self.counter),  item))
+    def append(self, item, value=None):
+        # the entry  [f(item), counter_value, item]  is pushed on the internal heapq
+        # f(item) is evaluated once here, unless the caller already passes it as value
+        if item in self.entries:
+            del self[item]
+        if value is None:
+            value = self.f(item)
+        entry = [value, next(self.counter), item]
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
 
     def extend(self, items):
         """Insert each item in items at its correct position."""
@@ -119,36 +251,45 @@ class PriorityQueue(Queue):
             self.append(item)
                 
     def __len__(self):
-        return len(self.heap)
+        return len(self.entries)
     
     def __str__(self):
-        return str(self.heap)
+        return str(sorted(self.entries.values()))
     
     def pop(self):
         """Pop and return the item with min f(x) value """
-        if self.heap:
-            # item is the last element of the tuple  (f(item), counter_value, item) 
-            return heapq.heappop(self.heap)[-1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
+        while self.heap:
+            # item is the last element of the entry  [f(item), counter_value, item] 
+            item = heapq.heappop(self.heap)[-1]
+            if item is not _REMOVED:
+                del self.entries[item]
+                return item
+        raise Exception('Trying to pop from empty PriorityQueue.')
     
     def __contains__(self, item):
         """Return True if item in PriorityQueue."""
-        return (self.f(item), item) in self.heap
+        return item in self.entries
+
+    def value(self, key):
+        """Return the f value stored with the queued item equal to key."""
+        return self.entries[key][0]
 
     def __getitem__(self, key):
-        for _,_, item in self.heap:
-            # Note that two instances of 'Node' are considered
-            # equal if their corresponding states are the same.
-            if item == key:
-                return item
+        # Note that two instances of 'Node' are considered
+        # equal if their corresponding states are the same.
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry[-1]
             
     def __delitem__(self, key):
-        for f_value,count_value,item in self.heap:
-            if item == key:
-                self.heap.remove((f_value,count_value,item))
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            # mark the entry as removed, pop will skip it
+            entry[-1] = _REMOVED
+            # drop the removed entries once they make up most of the heap
+            if len(self.heap) > 2 * len(self.entries) + 64:
+                self.heap = [e for e in self.heap if e[-1] is not _REMOVED]
                 heapq.heapify(self.heap)
-                return
 
 #______________________________________________________________________________
 
@@ -259,6 +400,28 @@ class Node:
 
 # Uninformed Search algorithms
 
+def add_explored(explored, node):
+    """
+    Add the state of node to the explored states, a set or a TranspositionTable
+    (which also keeps the path cost, the parent state and the depth of the node).
+    """
+    if isinstance(explored, set):
+        explored.add(node.state)
+    else:
+        explored.store(node.state, node.path_cost, node.parent.state if node.parent else None, node.depth)
+
+
+def event_hooks(problem, *events):
+    """
+    The lists of callbacks of the events (see SearchEvents) subscribed through problem.events,
+    empty tuples if the problem has no events. The engines only call the hooks of non-empty lists.
+    """
+    search_events = getattr(problem, 'events', None)
+    if search_events is None:
+        return tuple(() for _ in events)
+    return tuple(search_events.hooks(event) for event in events)
+
+
 def tree_search(problem, frontier):
     """
         Search through the successors of a problem to find a goal.
@@ -277,7 +440,7 @@ def tree_search(problem, frontier):
         frontier.extend(node.expand(problem))
     return None
 
-def graph_search(problem, frontier):
+def graph_search(problem, frontier, stats=None, time_limit=None, node_limit=None, memory_limit=None, explored=None):
     """
     Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
@@ -285,19 +448,35 @@ def graph_search(problem, frontier):
     Return
         the node of the first goal state found
         or None is no goal state is found
+        or 'timeout' if a limit was reached first (see limit_reached)
+    The explored states are kept in a set, or in 'explored' if given
+    (a TranspositionTable bounds the memory of the explored states, not of the frontier).
     """
     assert isinstance(problem, Problem)
+    stats = stats or SearchStats()
+    stats.start()
     frontier.append(Node(problem.initial))
-    explored = set() # initial empty set of explored states
+    explored = set() if explored is None else explored # initial empty set of explored states
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
+            stats.stop()
             return node
-        explored.add(node.state)
+        reason = limit_reached(stats, time_limit, node_limit, memory_limit)
+        if reason:
+            stats.stop(reason)
+            return 'timeout'
+        add_explored(explored, node)
+        children = node.expand(problem)
+        stats.expanded += 1
+        stats.generated += len(children)
         # Python note: next line uses of a generator
-        frontier.extend(child for child in node.expand(problem)
+        frontier.extend(child for child in children
                         if child.state not in explored
                         and child not in frontier)
+        if len(frontier) > stats.frontier_max:
+            stats.frontier_max = len(frontier)
+    stats.stop()
     return None
 
 
@@ -322,65 +501,135 @@ def breadth_first_graph_search(problem):
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 
-def best_first_tree_search(problem, f):
+def best_first_tree_search(problem, f, stats=None, time_limit=None, node_limit=None, memory_limit=None):
     """
     Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
+    The counters of the search are written to stats (a SearchStats) if given.
+    The search stops and returns 'timeout' when one of the limits is reached
+    (see limit_reached), stats then holds the counters of the partial search.
     """
+    stats = stats or SearchStats()
+    stats.start()
     node = Node(problem.initial)
     if problem.goal_test(node.state):
+        stats.stop()
         return node
     frontier = PriorityQueue(f)
     frontier.append(node)
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
+            stats.stop()
             return node
-        for child in node.expand(problem):
+        reason = limit_reached(stats, time_limit, node_limit, memory_limit)
+        if reason:
+            stats.stop(reason)
+            return 'timeout'
+        children = node.expand(problem)
+        stats.expanded += 1
+        stats.generated += len(children)
+        for child in children:
             if child not in frontier:
                 frontier.append(child)
-            elif child in frontier:
-                incumbent = frontier[child] # incumbent is a node
-                if f(child) < f(incumbent):
-                    del frontier[incumbent]
-                    frontier.append(child)
+            else:
+                # compare with the f value stored with the incumbent
+                value = f(child)
+                if value < frontier.value(child):
+                    del frontier[child]
+                    frontier.append(child, value)
+        if len(frontier) > stats.frontier_max:
+            stats.frontier_max = len(frontier)
+    stats.stop()
     return None
 
 
 
-def best_first_graph_search(problem, f):
+def best_first_graph_search(problem, f, stats=None, time_limit=None, node_limit=None, memory_limit=None, explored=None):
     """
     Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
+    The counters of the search are written to stats (a SearchStats) if given.
+    The search stops and returns 'timeout' when one of the limits is reached
+    (see limit_reached), stats then holds the counters of the partial search.
+    The explored states are kept in a set, or in 'explored' if given
+    (a TranspositionTable bounds the memory of the explored states, not of the frontier).
+    If f has a 'batch' attribute, f.batch(nodes) gives the f values of a list of nodes
+    and is called once per expansion for all the new children.
+    The events subscribed through problem.events (see SearchEvents) are emitted.
     """
+    stats = stats or SearchStats()
+    stats.start()
+    batch = getattr(f, 'batch', None)
+    expanded_hooks, generated_hooks, pruned_hooks, solution_hooks = event_hooks(problem, 'expanded', 'generated', 'pruned', 'solution')
     node = Node(problem.initial)
     if problem.goal_test(node.state):
+        stats.stop()
+        for hook in solution_hooks:
+            hook('solution', node, stats)
         return node
     frontier = PriorityQueue(f)
     frontier.append(node)
-    explored = set()
+    explored = set() if explored is None else explored
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
+            stats.stop()
+            for hook in solution_hooks:
+                hook('solution', node, stats)
             return node
-        explored.add(node.state)
-        for child in node.expand(problem):
-            if child.state not in explored and child not in frontier:
-                frontier.append(child)
-            elif child in frontier:
-                incumbent = frontier[child] # incumbent is a node
-                if f(child) < f(incumbent):
-                    del frontier[incumbent]
-                    frontier.append(child)
+        reason = limit_reached(stats, time_limit, node_limit, memory_limit)
+        if reason:
+            stats.stop(reason)
+            return 'timeout'
+        add_explored(explored, node)
+        children = node.expand(problem)
+        stats.expanded += 1
+        stats.generated += len(children)
+        if expanded_hooks or generated_hooks or pruned_hooks:
+            emit_expansion(node, children, explored, expanded_hooks, generated_hooks, pruned_hooks)
+        children = [child for child in children if child.state not in explored]
+        values = batch(children) if batch is not None else [None] * len(children)
+        for child, value in zip(children, values):
+            if child not in frontier:
+                frontier.append(child, value)
+            else:
+                # compare with the f value stored with the incumbent
+                if value is None:
+                    value = f(child)
+                if value < frontier.value(child):
+                    del frontier[child]
+                    frontier.append(child, value)
+                else:
+                    for hook in pruned_hooks:
+                        hook('pruned', child, 'duplicate')
+        if len(frontier) > stats.frontier_max:
+            stats.frontier_max = len(frontier)
+    stats.stop()
     return None
 
-def uniform_cost_search(problem):
+def emit_expansion(node, children, explored, expanded_hooks, generated_hooks, pruned_hooks):
+    """
+    Emit the 'expanded' event of node, the 'generated' events of its children
+    and the 'pruned' events of the children already explored.
+    """
+    for hook in expanded_hooks:
+        hook('expanded', node)
+    for child in children:
+        for hook in generated_hooks:
+            hook('generated', child)
+        if pruned_hooks and child.state in explored:
+            for hook in pruned_hooks:
+                hook('pruned', child, 'explored')
+
+
+def uniform_cost_search(problem, stats=None, **options):
     "[Fig. 3.14]"
-    return best_first_graph_search(problem, lambda node: node.path_cost)
+    return best_first_graph_search(problem, lambda node: node.path_cost, stats, **options)
 
 def depth_limited_search(problem, limit=50):
     "[Fig. 3.17]"
@@ -418,18 +667,196 @@ def iterative_deepening_search(problem):
 greedy_best_first_graph_search = best_first_graph_search
     # Greedy best-first search is accomplished by specifying f(n) = h(n).
 
-def astar_graph_search(problem, h=None):
+def astar_graph_search(problem, h=None, stats=None, **options):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
-    else in your Problem subclass."""
-    h = memoize(h or problem.h)
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n))
+    else in your Problem subclass. A batched h.batch(nodes) is used like
+    f.batch in best_first_graph_search.
+    h is called directly: an unbounded memo of h would keep every node, the
+    Sokoban heuristics cache their values by state in a bounded LRUCache
+    (see Heuristics.node_value)."""
+    h = h or problem.h
+    h_batch = getattr(h, 'batch', None)
+    f = lambda n: n.path_cost + h(n)
+    if h_batch is not None:
+        f.batch = lambda nodes: [n.path_cost + value for n, value in zip(nodes, h_batch(nodes))]
+    return best_first_graph_search(problem, f, stats, **options)
+
+
+def ida_star_search(problem, h=None, stats=None, time_limit=None, node_limit=None, memory_limit=None, explored=None):
+    """
+    Iterative deepening A*: depth-first searches bounded by f(n) = g(n)+h(n),
+    the bound growing to the smallest f that went over it, until a goal is found.
+    The solution has the lowest path cost if h is admissible, and the memory
+    is linear in the depth of the solution (plus the optional table).
+
+    The search runs with an explicit stack, so deep solutions do not hit the recursion limit.
+    States already on the current path are skipped. If explored (a TranspositionTable) is given,
+    a state reached again in the same iteration with a path cost that is not lower is skipped too.
+    The counters, limits and events are the same as for best_first_graph_search
+    ('timeout' is returned when a limit is reached).
+    """
+    h = h or problem.h
+    stats = stats or SearchStats()
+    stats.start()
+    expanded_hooks, generated_hooks, pruned_hooks, solution_hooks = event_hooks(problem, 'expanded', 'generated', 'pruned', 'solution')
+    root = Node(problem.initial)
+    bound = root.path_cost + h(root)
+    while True:
+        if explored is not None:
+            # The entries of the previous iteration were searched with a lower bound.
+            explored.clear()
+        next_bound = float('inf')
+        # stack[i + 1] iterates over the children of path[i]
+        stack = [iter([root])]
+        path = []
+        on_path = set()
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                if path:
+                    on_path.discard(path.pop().state)
+                continue
+            f = node.path_cost + h(node)
+            if f > bound:
+                next_bound = min(next_bound, f)
+                for hook in pruned_hooks:
+                    hook('pruned', node, 'bound')
+                continue
+            if node.state in on_path:
+                continue
+            if problem.goal_test(node.state):
+                stats.stop()
+                for hook in solution_hooks:
+                    hook('solution', node, stats)
+                return node
+            if explored is not None:
+                entry = explored.lookup(node.state)
+                if entry is not None and entry[0] <= node.path_cost:
+                    for hook in pruned_hooks:
+                        hook('pruned', node, 'explored')
+                    continue
+                # The depth of the entry is the cost left before reaching the bound.
+                explored.store(node.state, node.path_cost, node.parent.state if node.parent else None, bound - node.path_cost)
+            reason = limit_reached(stats, time_limit, node_limit, memory_limit)
+            if reason:
+                stats.stop(reason)
+                return 'timeout'
+            children = node.expand(problem)
+            stats.expanded += 1
+            stats.generated += len(children)
+            for hook in expanded_hooks:
+                hook('expanded', node)
+            if generated_hooks:
+                for child in children:
+                    for hook in generated_hooks:
+                        hook('generated', child)
+            path.append(node)
+            on_path.add(node.state)
+            stack.append(iter(children))
+            if len(stack) > stats.frontier_max:
+                stats.frontier_max = len(stack)
+        if next_bound == float('inf'):
+            stats.stop()
+            return None
+        bound = next_bound
+
+
+def bidirectional_search(problem, h=None, stats=None, time_limit=None, node_limit=None, memory_limit=None, explored=None):
+    """
+    Bidirectional breadth-first search.
+
+    A forward search from problem.initial and a backward search from the goal states meet
+    when a state generated by one side is already known by the other side.
+    The problem must also define:
+        backward_initial_states(): the goal states the backward search starts from
+        backward_actions(state), backward_result(state, action): the reversed moves
+        forward_action(backward_action): the forward action undoing a backward action
+            (from the state backward_result(state, backward_action) back to state)
+    Each side expands a whole level at a time, the side with the smaller frontier first.
+    The known states of both sides are kept in dictionaries (state -> previous state and action),
+    h and explored are accepted for the common engine signature but not used.
+    Only the 'solution' event of problem.events is emitted (the sides do not build nodes).
+
+    Returns the goal node of the forward path, None if there is no solution,
+    or 'timeout' if a limit is reached (see limit_reached).
+    Raises ValueError if the problem does not define the backward search.
+    """
+    for name in ('backward_initial_states', 'backward_actions', 'backward_result', 'forward_action'):
+        if not callable(getattr(problem, name, None)):
+            raise ValueError("bidirectional_search needs a problem with a backward search (no {})".format(name))
+
+    stats = stats or SearchStats()
+    stats.start()
+    solution_hooks, = event_hooks(problem, 'solution')
+    root = Node(problem.initial)
+    if problem.goal_test(root.state):
+        stats.stop()
+        for hook in solution_hooks:
+            hook('solution', root, stats)
+        return root
+
+    forward = {root.state: None}
+    backward = {state: None for state in problem.backward_initial_states()}
+    forward_frontier = [root.state]
+    backward_frontier = list(backward)
+
+    def solution_node(meet):
+        # Chain the forward path to the meeting state, then undo the backward path from it.
+        actions = []
+        state = meet
+        while forward[state] is not None:
+            state, action = forward[state]
+            actions.append(action)
+        actions.reverse()
+        state = meet
+        while backward[state] is not None:
+            state, action = backward[state]
+            actions.append(problem.forward_action(action))
+        node = root
+        for action in actions:
+            node = node.child_node(problem, action)
+        for hook in solution_hooks:
+            hook('solution', node, stats)
+        return node
+
+    while forward_frontier and backward_frontier:
+        from_forward = len(forward_frontier) <= len(backward_frontier)
+        frontier, known, other = (forward_frontier, forward, backward) if from_forward else (backward_frontier, backward, forward)
+        next_frontier = []
+        for state in frontier:
+            reason = limit_reached(stats, time_limit, node_limit, memory_limit)
+            if reason:
+                stats.stop(reason)
+                return 'timeout'
+            actions = problem.actions(state) if from_forward else problem.backward_actions(state)
+            stats.expanded += 1
+            stats.generated += len(actions)
+            for action in actions:
+                child = problem.result(state, action) if from_forward else problem.backward_result(state, action)
+                if child in known:
+                    continue
+                if child in other:
+                    known[child] = (state, action)
+                    stats.stop()
+                    return solution_node(child)
+                known[child] = (state, action)
+                next_frontier.append(child)
+        if from_forward:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+        if len(forward_frontier) + len(backward_frontier) > stats.frontier_max:
+            stats.frontier_max = len(forward_frontier) + len(backward_frontier)
+    stats.stop()
+    return None
 
 
-def astar_tree_search(problem, h=None):
+def astar_tree_search(problem, h=None, stats=None, **options):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
     else in your Problem subclass."""
     h = h or problem.h
-    return best_first_tree_search(problem, lambda n: n.path_cost + h(n))
+    return best_first_tree_search(problem, lambda n: n.path_cost + h(n), stats, **options)
 
@@ -54,32 +54,160 @@ def find_2D_iterator(lines, char):
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+class FrozenWarehouse:
+    '''
+    An immutable warehouse.
+    The layout is a flat array of cell types ('self.cells', FLOOR, WALL or TARGET,
+    row-major over x_size * y_size) and the walls and targets are frozensets
+    of (x,y) coordinates, so every membership test is O(1).
+    'self.worker' is a tuple (x,y) and 'self.boxes' a tuple of (x,y) tuples.
+    A FrozenWarehouse can be shared between threads. with_state (or copy) returns the
+    same layout with other positions of the worker and the boxes, without copying the layout.
+    It can be given to check_action_seq and SequenceValidator instead of a Warehouse.
+    '''
+    __slots__ = ('walls', 'targets', 'x_size', 'y_size', 'cells', 'worker', 'boxes')
+
+    FLOOR, WALL, TARGET = 0, 1, 2
+
+    def __init__(self, walls, targets, worker, boxes):
+        walls, targets = frozenset(walls), frozenset(targets)
+        x_size, y_size = 1 + max(x for x, y in walls), 1 + max(y for x, y in walls)
+        cells = bytearray(x_size * y_size)
+        for (x, y) in walls:
+            cells[y * x_size + x] = FrozenWarehouse.WALL
+        for (x, y) in targets:
+            cells[y * x_size + x] = FrozenWarehouse.TARGET
+        for name, value in (('walls', walls), ('targets', targets), ('x_size', x_size), ('y_size', y_size),
+                            ('cells', bytes(cells)), ('worker', worker), ('boxes', tuple(boxes))):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FrozenWarehouse is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('FrozenWarehouse is immutable')
+
+    def __reduce__(self):
+        return FrozenWarehouse, (self.walls, self.targets, self.worker, self.boxes)
+
+    def with_state(self, worker, boxes):
+        '''
+        Return the warehouse with the same layout, the worker and the boxes at the given positions.
+        '''
+        result = object.__new__(FrozenWarehouse)
+        for name in ('walls', 'targets', 'x_size', 'y_size', 'cells'):
+            object.__setattr__(result, name, getattr(self, name))
+        object.__setattr__(result, 'worker', worker)
+        object.__setattr__(result, 'boxes', tuple(boxes))
+        return result
+
+    def copy(self, worker = None, boxes = None):
+        '''
+        Same as Warehouse.copy: the warehouse with the same layout, possibly with
+        new positions for the worker and the boxes (see with_state).
+        '''
+        return self.with_state(worker or self.worker, boxes or self.boxes)
+
+    def cell_type(self, pos):
+        '''
+        Type of the cell at pos (x,y), WALL outside the layout.
+        '''
+        x, y = pos
+        if 0 <= x < self.x_size and 0 <= y < self.y_size:
+            return self.cells[y * self.x_size + x]
+        return FrozenWarehouse.WALL
+
+    def is_wall(self, pos):
+        return self.cell_type(pos) == FrozenWarehouse.WALL
+
+    def thaw(self):
+        '''
+        Return a (mutable) Warehouse with this layout and state.
+        '''
+        result = Warehouse()
+        result.worker = self.worker
+        result.boxes = list(self.boxes)
+        result.walls = self.walls
+        result.targets = self.targets
+        return result
+
+    def __str__(self):
+        return str(self.thaw())
+
+    def __eq__(self, other):
+        return self.worker == other.worker and \
+               set(self.boxes) == set(other.boxes)
+
+    def __hash__(self):
+        return functools.reduce(operator.xor, map(hash, self.boxes), hash(self.worker))
+
+
 class Warehouse:
     '''
     A Warehouse instance represents the configuration of a warehouse, including
     the position of the walls, targets, boxes and the worker.
-    The attributes 'self.boxes', 'self.targets' and 'self.walls'
-    are lists of (x,y) coordinates.
+    The attribute 'self.boxes' is a list of (x,y) coordinates.
+    The attributes 'self.targets' and 'self.walls' are frozensets of (x,y)
+    coordinates (any collection assigned to them is frozen), so that membership
+    tests are O(1) and the layout can be shared between copies and threads.
     The attribute 'self.worker' is a tuple (x,y)
     The origin is at the top left. 
     The horizontal axis 'x' is pointing right.
     The vertical axis 'y' is pointing down.
+    freeze() returns the immutable FrozenWarehouse of the current state.
     '''
+    __slots__ = ('worker', 'boxes', '_walls', '_targets', '_layout')
+
+    def __init__(self):
+        self.worker = None
+        self.boxes = []
+        self._walls = frozenset()
+        self._targets = frozenset()
+        # FrozenWarehouse of the walls and targets, built on first use by freeze().
+        self._layout = None
+
+    @property
+    def walls(self):
+        return self._walls
+
+    @walls.setter
+    def walls(self, walls):
+        self._walls = frozenset(walls)
+        self._layout = None
+
+    @property
+    def targets(self):
+        return self._targets
+
+    @targets.setter
+    def targets(self, targets):
+        self._targets = frozenset(targets)
+        self._layout = None
+
+    def freeze(self):
+        '''
+        Return the FrozenWarehouse of this warehouse (the layout is built once and shared).
+        '''
+        if self._layout is None:
+            self._layout = FrozenWarehouse(self._walls, self._targets, self.worker, self.boxes)
+        return self._layout.with_state(self.worker, self.boxes)
+
     def copy(self, worker = None, boxes = None):
         '''
         Return a clone of this warehouse. 
         Possibly with new positions for the worker and the boxes 
         if the values of these parameters are not 'None'.  
-        Targets and Walls are copied (shallow copy)
+        Targets and Walls are shared (they are immutable), the list of boxes is copied.
         @param
             worker : a (x,y) tuple, position of the agent
             boxes : list of (x,y) pairs, positions of the boxes
         '''
         result = Warehouse()
         result.worker = worker or self.worker
-        result.boxes = boxes or self.boxes
-        result.targets = self.targets
-        result.walls = self.walls
+        result.boxes = list(boxes or self.boxes)
+        result._targets = self._targets
+        result._walls = self._walls
+        result._layout = self._layout
         return result
 
     def load_warehouse(self, filePath):
@@ -124,16 +252,18 @@ class Warehouse:
         assert len(workers)+len(workers_on_a_target) == 1 
         if len(workers) == 1:
             self.worker = workers[0]
-        self.boxes = list(find_2D_iterator(lines, "$")) # crate/box
-        self.targets = list(find_2D_iterator(lines, ".")) # empty target
+        boxes = list(find_2D_iterator(lines, "$")) # crate/box
+        targets = list(find_2D_iterator(lines, ".")) # empty target
         targets_with_boxes = list(find_2D_iterator(lines, "*")) # box on target
-        self.boxes += targets_with_boxes
-        self.targets += targets_with_boxes
+        boxes += targets_with_boxes
+        targets += targets_with_boxes
         if len(workers_on_a_target) == 1:
             self.worker = workers_on_a_target[0]
-            self.targets.append(self.worker) 
-        self.walls = list(find_2D_iterator(lines, "#")) # set(find_2D_iterator(lines, "#"))
-        assert len(self.boxes) == len(self.targets)
+            targets.append(self.worker) 
+        assert len(boxes) == len(targets)
+        self.boxes = boxes
+        self.targets = targets
+        self.walls = find_2D_iterator(lines, "#")
 
     def __str__(self):
         '''
@@ -169,7 +299,7 @@ class Warehouse:
                self.boxes == other.boxes
 
     def __hash__(self):
-        return hash(self.worker) ^ functools.reduce(operator.xor, [hash(box) for box in self.boxes])
+        return functools.reduce(operator.xor, map(hash, self.boxes), hash(self.worker))
     
 if __name__ == "__main__":
     wh = Warehouse()